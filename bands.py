@@ -0,0 +1,130 @@
+"""Runs the sand/water/acid pass of very large worlds in worker processes.
+
+The world arrays are moved into multiprocessing.shared_memory and the chunk rows
+are split into horizontal bands, two per worker. A tick runs in two phases: the
+workers update their even bands (counted from the bottom), then their odd bands.
+Two bands of a phase always have a whole band between them, at least one chunk
+high, and a particle never reaches further than half a chunk out of its band
+(see particle_system.check_reach), so particles cross band borders without two
+workers touching the same cell. The shared memory is the halo: there
+is nothing to copy between ticks. As in the parallel update, changes are flagged
+per cell and folded into the chunk rects once the phases are done. The other
+stages still run in the main process.
+
+    python headless.py --width 2000 --height 1500 --workers 4 --paint sand:1000,100,300
+"""
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import particle_system
+from config import *
+from materials import MATERIAL_TABLES
+
+# the arrays the workers share, in the order of particle_system.parallel_world_arrays()
+SHARED_ARRAYS = ("grid", "grid_color", "grid_vx", "grid_vy", "grid_tx", "grid_ty", "grid_lifespan",
+                 "redraw_cells", "changed_cells", "chunk_awake", "chunk_rect", "updated_tick")
+
+workers = []  # (process, connection) of every worker
+_memory = {}  # name -> SharedMemory of every shared array
+_arrays = {}  # name -> the array in _memory, what particle_system uses while the workers run
+
+
+def band_rows(height: int, bands: int):
+    """(top, bottom) rows of every band, from the bottom band to the top one. Bands are whole chunk rows."""
+    chunks_y = (height + CHUNK_SIZE - 1) // CHUNK_SIZE
+    rows = []
+    for chunk_rows in np.array_split(np.arange(chunks_y)[::-1], min(bands, chunks_y)):
+        rows.append((int(chunk_rows[-1]) * CHUNK_SIZE, min((int(chunk_rows[0]) + 1) * CHUNK_SIZE, height) - 1))
+    return rows
+
+
+def _attach(layout: dict):
+    """Maps the shared arrays of layout (name -> (memory name, shape, dtype)) into this process."""
+    memory, arrays = {}, {}
+    for name, (memory_name, shape, dtype) in layout.items():
+        memory[name] = shared_memory.SharedMemory(name=memory_name)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=memory[name].buf)
+    return memory, arrays
+
+
+def _work(layout: dict, rows: list, connection):
+    """Main loop of a worker: runs the phase it is told to on its band until it gets None."""
+    memory, arrays = _attach(layout)
+    world = tuple(arrays[name] for name in SHARED_ARRAYS[:9]) + (CHUNK_SIZE,)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        tick, seed, phase = message
+        top, bottom = rows[phase] if phase < len(rows) else (0, -1)
+        connection.send(particle_system._update_rows_kernel(world, MATERIAL_TABLES, particle_system.PHYSICS, arrays["chunk_awake"], arrays["chunk_rect"],
+                                                            arrays["updated_tick"], tick, seed, top, bottom))
+    del world, arrays
+    for shared in memory.values():
+        shared.close()
+
+
+def _share_world():
+    """Moves the current world arrays into shared memory and points particle_system at the shared copies."""
+    for name in SHARED_ARRAYS:
+        array = getattr(particle_system, name)
+        _memory[name] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        _arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=_memory[name].buf)
+        _arrays[name][...] = array
+        setattr(particle_system, name, _arrays[name])
+
+
+def _unshare_world():
+    """Copies the shared arrays back into private ones and frees the shared memory."""
+    for name in SHARED_ARRAYS:
+        if getattr(particle_system, name) is _arrays[name]:
+            setattr(particle_system, name, _arrays[name].copy())
+    _arrays.clear()
+    for shared in _memory.values():
+        shared.close()
+        shared.unlink()
+    _memory.clear()
+
+
+def _update(seed):
+    """particle_system.band_update: runs both phases of the particle pass on the workers."""
+    if any(getattr(particle_system, name) is not _arrays[name] for name in SHARED_ARRAYS):  # a new world
+        start(len(workers))
+    moved = 0
+    for phase in range(2):
+        for _, connection in workers:
+            connection.send((particle_system.tick, seed, phase))
+        moved += sum(connection.recv() for _, connection in workers)
+    return moved
+
+
+def start(worker_count: int):
+    """Moves the world into shared memory and starts worker_count workers, 2 * worker_count bands."""
+    stop()
+    particle_system.check_reach("the bands")
+    _share_world()
+    layout = {name: (_memory[name].name, array.shape, array.dtype.str) for name, array in _arrays.items()}
+    rows = band_rows(particle_system.GRID_HEIGHT, 2 * worker_count)
+    context = multiprocessing.get_context("spawn")  # fork would copy numba's threads in an unknown state
+    for index in range((len(rows) + 1) // 2):
+        connection, worker_connection = context.Pipe()
+        process = context.Process(target=_work, args=(layout, rows[2 * index:2 * index + 2], worker_connection), daemon=True)
+        process.start()
+        workers.append((process, connection))
+    particle_system.band_update = _update
+
+
+def stop():
+    """Stops the workers, the world goes back to private memory."""
+    if not workers:
+        return
+    particle_system.band_update = None
+    for process, connection in workers:
+        connection.send(None)
+        process.join()
+    workers.clear()
+    _unshare_world()
+
+
+atexit.register(stop)
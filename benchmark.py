@@ -0,0 +1,160 @@
+"""Benchmarks the simulation on fixed scenarios, without a window.
+
+Every stage of a frame is timed on its own. For each scenario the output has the
+mean ms/frame of every stage, the p50/p99 of the whole frame and the particles
+updated per second, as JSON so runs on two commits can be compared:
+
+    python benchmark.py --frames 300 --output before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # keeps stdout valid JSON
+import pygame
+import config
+import headless
+import particle_system
+import utils
+
+
+def _sand_pile(frame: int, width: int, height: int):
+    if frame < 200:
+        headless.paint(config.SAND_ID, width // 2, 2, 2)
+
+
+def _water_tank(frame: int, width: int, height: int):
+    if frame == 0:
+        left, right = width // 4, 3 * width // 4
+        for y in range(height // 3, height):
+            headless.paint(config.STONE_ID, left, y)
+            headless.paint(config.STONE_ID, right, y)
+        for x in range(left, right + 1):
+            headless.paint(config.STONE_ID, x, height - 1)
+    if frame < 250:
+        headless.paint(config.WATER_ID, width // 2, 2, 2)
+
+
+def _forest_fire(frame: int, width: int, height: int):
+    if frame == 0:
+        for y in range(height // 2, height):
+            for x in range(0, width, 7):
+                headless.paint(config.WOOD_ID, x, y, 1)
+        headless.stroke(config.FIRE_ID, 0, height - 1, width - 1, height - 1)
+
+
+def _acid_bath(frame: int, width: int, height: int):
+    if frame == 0:
+        for y in range(height // 2, height):
+            headless.stroke(config.ACID_ID, 0, y, width - 1, y)
+    if frame < 200:
+        headless.paint(config.SAND_ID, width // 3, 2, 2)
+        headless.paint(config.WOOD_ID, 2 * width // 3, 2, 1)
+
+
+def _steam_column(frame: int, width: int, height: int):
+    if frame < 250:
+        headless.paint(config.STEAM_ID, width // 2, height - 3, 2)
+
+
+def _anniversaire(frame: int, width: int, height: int):
+    if frame == 0:
+        for text, height_center in (("HAPPY", 0.6), ("BIRTHDAY", 1.4)):
+            for x, y in utils.get_text_pixels_pygame(text, width, height, height_center):
+                headless.paint(config.CHROMATIC_ID, x, y)
+
+
+# name -> function painting the world, called before every frame
+SCENARIOS = {
+    "sand_pile": _sand_pile,
+    "water_tank": _water_tank,
+    "forest_fire": _forest_fire,
+    "acid_bath": _acid_bath,
+    "steam_column": _steam_column,
+    "anniversaire": _anniversaire,
+}
+
+# stages returning how many particles they updated (reacted, moved, visited or burned), summed into particles_per_s
+COUNTED_STAGES = (
+    particle_system.update_reactions,
+    particle_system.update_particles,
+    particle_system.update_smoke_particles,
+    particle_system.update_fire_particles,
+    particle_system.update_burning_wood,
+)
+
+
+def run_scenario(name: str, frames: int, width: int, height: int, seed: int = 0):
+    """Runs one scenario from an empty world and returns its measures."""
+    headless.new_world(width, height, seed)
+    target = pygame.Surface((config.SCREEN_WIDTH, config.WINDOW_HEIGHT))
+    stages = [
+        ("input", lambda: SCENARIOS[name](frame, width, height)),
+        *((stage.__name__, stage) for stage in particle_system.SIMULATION_STAGES),
+        ("draw_grid", lambda: particle_system.draw_grid(target)),
+        ("cycle_colors", lambda: particle_system.cycle_colors(config.CHROMATIC_PALETTE, config.palette_size, frame / config.FPS_LIMIT)),
+    ]
+    stage_times = np.zeros((frames, len(stages)))
+    particles = 0
+    for frame in range(frames):
+        for index, (_, stage) in enumerate(stages):
+            start = time.perf_counter()
+            updated = stage()
+            stage_times[frame, index] = time.perf_counter() - start
+            if stage in COUNTED_STAGES:
+                particles += int(updated)
+        config.frame_count += 1
+    frame_ms = stage_times.sum(axis=1) * 1000
+    return {
+        "frames": frames,
+        "grid": [width, height],
+        "stages_ms": {stage: round(float(stage_times[:, index].mean() * 1000), 4) for index, (stage, _) in enumerate(stages)},
+        "frame_ms": {
+            "mean": round(float(frame_ms.mean()), 4),
+            "p50": round(float(np.percentile(frame_ms, 50)), 4),
+            "p99": round(float(np.percentile(frame_ms, 99)), 4),
+        },
+        "particles_per_s": round(particles / max(frame_ms.sum() / 1000, 1e-9)),
+        "final_counts": headless.material_counts().tolist(),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the simulation on fixed scenarios.")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=config.GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=config.GRID_HEIGHT)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="can be repeated, default is all of them")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the JSON to, default is stdout")
+    args = parser.parse_args()
+
+    pygame.font.init()  # for the text of the anniversaire scenario
+    run_scenario("sand_pile", 30, args.width, args.height, args.seed)  # warm-up for jit functions
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "parallel": particle_system.parallel,
+        "scenarios": {name: run_scenario(name, args.frames, args.width, args.height, args.seed)
+                      for name in args.scenario or SCENARIOS},
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
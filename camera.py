@@ -0,0 +1,69 @@
+"""Which part of the world the window shows, and how big.
+
+The camera looks at the world from (x, y), the top left cell in view, with zoom
+screen pixels per cell. x and y keep the fractions of cells the camera was moved
+by, so slow moves add up, they are rounded down to whole cells when drawing. Only the cells in view are drawn, so the world can be far
+bigger than the screen. zoom is one of ZOOMS, below 1 a screen pixel covers
+several cells.
+"""
+import math
+from config import *
+
+ZOOMS = (0.125, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+x = 0.0
+y = 0.0
+zoom = CELL_SIZE
+world_width = GRID_WIDTH
+world_height = GRID_HEIGHT
+
+
+def set_world(width: int, height: int):
+    """To call when the world changes size, keeps the camera inside it."""
+    global world_width, world_height
+    world_width, world_height = width, height
+    _clamp()
+
+
+def view_size():
+    """Number of cells in view, across and down."""
+    return min(math.ceil(SCREEN_WIDTH / zoom), world_width), min(math.ceil(WINDOW_HEIGHT / zoom), world_height)
+
+
+def visible_rect():
+    """(x0, y0, x1, y1) of the cells in view, bounds included."""
+    width, height = view_size()
+    return int(x), int(y), int(x) + width - 1, int(y) + height - 1
+
+
+def _clamp():
+    global x, y
+    width, height = view_size()
+    x = min(max(x, 0), world_width - width)
+    y = min(max(y, 0), world_height - height)
+
+
+def pan(dx: float, dy: float):
+    """Moves the camera by (dx, dy) screen pixels."""
+    global x, y
+    x += dx / zoom
+    y += dy / zoom
+    _clamp()
+
+
+def zoom_at(steps: int, screen_x: int, screen_y: int):
+    """Zooms in (steps > 0) or out by steps of ZOOMS, keeping the cell under (screen_x, screen_y) in place."""
+    global x, y, zoom
+    cell_x, cell_y = x + screen_x / zoom, y + screen_y / zoom
+    level = min(range(len(ZOOMS)), key=lambda index: abs(ZOOMS[index] - zoom))  # CELL_SIZE may not be in ZOOMS
+    zoom = ZOOMS[min(max(level + steps, 0), len(ZOOMS) - 1)]
+    x, y = cell_x - screen_x / zoom, cell_y - screen_y / zoom
+    _clamp()
+
+
+def screen_to_cell(screen_x: int, screen_y: int):
+    """The (x, y) cell under a screen pixel, None if the pixel is not over the world."""
+    cell_x, cell_y = int(x) + int(screen_x // zoom), int(y) + int(screen_y // zoom)
+    if 0 <= screen_x < SCREEN_WIDTH and 0 <= cell_x < world_width and 0 <= cell_y < world_height:
+        return cell_x, cell_y
+    return None
@@ -0,0 +1,156 @@
+import numpy as np
+from numba import jit, prange
+from config import *
+
+# The grid is split in CHUNK_SIZE x CHUNK_SIZE chunks. Every change to a cell grows
+# the changed rect of its chunk, at the start of a frame those rects (plus a one cell
+# border) become the rects that get simulated. A chunk with no rect is asleep and
+# costs nothing. Redrawing has its own rects, emptied when the frame is drawn.
+# Rects are [x0, y0, x1, y1] in grid coordinates, bounds included, and a rect with
+# x0 > x1 is empty.
+# The mark functions also accept a per cell flag array instead of the rects, this
+# is what the parallel update uses so that two chunks never grow the same rect at
+# the same time. fold_cells turns those flags back into rects.
+# The jitted functions take the chunk size as an argument: numba caches them
+# compiled, and a global read in them would keep the value it had back then.
+
+NO_RECT = np.iinfo(np.int32).max
+
+
+def chunk_count(grid_width: int, grid_height: int):
+    return (grid_height + CHUNK_SIZE - 1) // CHUNK_SIZE, (grid_width + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+
+def new_rects(grid_width: int, grid_height: int):
+    chunks_y, chunks_x = chunk_count(grid_width, grid_height)
+    rects = np.empty((chunks_y, chunks_x, 4), dtype=np.int32)
+    clear_rects(rects)
+    return rects
+
+
+@jit(nopython=True, cache=True)
+def clear_rects(rects):
+    rects[:, :, 0] = NO_RECT
+    rects[:, :, 1] = NO_RECT
+    rects[:, :, 2] = -1
+    rects[:, :, 3] = -1
+
+
+@jit(nopython=True, cache=True)
+def fill_rects(rects, grid_width, grid_height, chunk_size):
+    """Sets every rect to its whole chunk."""
+    chunks_y, chunks_x = rects.shape[:2]
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            rects[cy, cx, 0] = cx * chunk_size
+            rects[cy, cx, 1] = cy * chunk_size
+            rects[cy, cx, 2] = min((cx + 1) * chunk_size, grid_width) - 1
+            rects[cy, cx, 3] = min((cy + 1) * chunk_size, grid_height) - 1
+
+
+@jit(nopython=True, cache=True)
+def _grow_rect(rects, cy, cx, x0, y0, x1, y1):
+    if x0 < rects[cy, cx, 0]:
+        rects[cy, cx, 0] = x0
+    if y0 < rects[cy, cx, 1]:
+        rects[cy, cx, 1] = y0
+    if x1 > rects[cy, cx, 2]:
+        rects[cy, cx, 2] = x1
+    if y1 > rects[cy, cx, 3]:
+        rects[cy, cx, 3] = y1
+
+
+@jit(nopython=True, cache=True)
+def merge_rects(rects, other):
+    """Grows every rect of rects to also hold the same chunk's rect of other."""
+    chunks_y, chunks_x = rects.shape[:2]
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if other[cy, cx, 0] <= other[cy, cx, 2]:
+                _grow_rect(rects, cy, cx, other[cy, cx, 0], other[cy, cx, 1], other[cy, cx, 2], other[cy, cx, 3])
+
+
+@jit(nopython=True, cache=True)
+def _mark(rects, x, y, chunk_size):
+    if rects.ndim == 2:  # per cell flags
+        rects[y, x] = 1
+    else:
+        _grow_rect(rects, y // chunk_size, x // chunk_size, x, y, x, y)
+
+
+@jit(nopython=True, cache=True)
+def keep_awake(chunk_changed, x, y, chunk_size):
+    """Keeps the neighbourhood of (x, y) simulated next frame without redrawing the cell."""
+    _mark(chunk_changed, x, y, chunk_size)
+
+
+@jit(nopython=True, cache=True)
+def mark_changed(chunk_redraw, chunk_changed, x, y, chunk_size):
+    _mark(chunk_redraw, x, y, chunk_size)
+    _mark(chunk_changed, x, y, chunk_size)
+
+
+@jit(nopython=True, cache=True)
+def mark_cells(chunk_redraw, chunk_changed, xs, ys, chunk_size):
+    """mark_changed for every (xs[i], ys[i]), in one call."""
+    for i in range(len(xs)):
+        mark_changed(chunk_redraw, chunk_changed, xs[i], ys[i], chunk_size)
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def fold_cells(redraw_cells, changed_cells, chunk_redraw, chunk_changed, chunk_awake, chunk_size):
+    """Grows the rects of every chunk next to an awake one from its per cell flags.
+
+    Each chunk only reads its own cells and writes its own rects, so the chunks
+    are folded in parallel. The flags are cleared on the way.
+    """
+    grid_height, grid_width = changed_cells.shape
+    chunks_y, chunks_x = chunk_awake.shape
+    for index in prange(chunks_y * chunks_x):
+        cy = index // chunks_x
+        cx = index % chunks_x
+        if not chunk_awake[max(cy - 1, 0):cy + 2, max(cx - 1, 0):cx + 2].any():
+            continue
+        for y in range(cy * chunk_size, min((cy + 1) * chunk_size, grid_height)):
+            for x in range(cx * chunk_size, min((cx + 1) * chunk_size, grid_width)):
+                if redraw_cells[y, x]:
+                    _grow_rect(chunk_redraw, cy, cx, x, y, x, y)
+                    redraw_cells[y, x] = 0
+                if changed_cells[y, x]:
+                    _grow_rect(chunk_changed, cy, cx, x, y, x, y)
+                    changed_cells[y, x] = 0
+
+
+@jit(nopython=True, cache=True)
+def wake_chunks(chunk_changed, chunk_rect, chunk_awake, grid_width, grid_height, chunk_size):
+    """Turns the rects changed since the last call into the rects to simulate.
+
+    Each changed rect is grown by one cell so the neighbours of a changed cell get
+    updated, the part of it that crosses the chunk border wakes the neighbour chunk.
+    Returns the number of awake chunks.
+    """
+    chunks_y, chunks_x = chunk_awake.shape
+    clear_rects(chunk_rect)
+    chunk_awake[:, :] = 0
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if chunk_changed[cy, cx, 0] > chunk_changed[cy, cx, 2]:
+                continue
+            x0 = max(chunk_changed[cy, cx, 0] - 1, 0)
+            y0 = max(chunk_changed[cy, cx, 1] - 1, 0)
+            x1 = min(chunk_changed[cy, cx, 2] + 1, grid_width - 1)
+            y1 = min(chunk_changed[cy, cx, 3] + 1, grid_height - 1)
+            for ny in range(y0 // chunk_size, y1 // chunk_size + 1):
+                for nx in range(x0 // chunk_size, x1 // chunk_size + 1):
+                    _grow_rect(chunk_rect, ny, nx,
+                               max(x0, nx * chunk_size), max(y0, ny * chunk_size),
+                               min(x1, (nx + 1) * chunk_size - 1), min(y1, (ny + 1) * chunk_size - 1))
+                    chunk_awake[ny, nx] = 1
+    clear_rects(chunk_changed)
+    return np.count_nonzero(chunk_awake)
+
+
+def rects_in_use(rects):
+    """Returns the list of (x0, y0, x1, y1) of the non empty rects."""
+    cys, cxs = np.nonzero(rects[:, :, 0] <= rects[:, :, 2])
+    return [tuple(rect) for rect in rects[cys, cxs].tolist()]
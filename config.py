@@ -8,7 +8,24 @@ TOOLBAR_WIDTH = 400
 SCREEN_WIDTH = WINDOW_WIDTH - TOOLBAR_WIDTH
 GRID_HEIGHT = WINDOW_HEIGHT // CELL_SIZE
 GRID_WIDTH = (WINDOW_WIDTH - TOOLBAR_WIDTH) // CELL_SIZE
+WORLD_WIDTH = GRID_WIDTH # the world can be bigger than the screen, the camera shows part of it (see camera.py)
+WORLD_HEIGHT = GRID_HEIGHT
+PAGED_WORLD_PATH = None # directory to keep the world in as memory-mapped files (see paging.py), None keeps it in memory; only Linux gives the memory of unused rows back
+PAGED_WORLD_BUDGET_MB = 512 # memory the rows of a paged world may use
+CAMERA_PAN_SPEED = 600 # screen pixels per second the arrow keys move the camera by
 FPS_LIMIT = 60
+SIMULATION_TICKS_PER_SECOND = 60 # the simulation runs at this rate whatever the fps
+MAX_CATCH_UP_TICKS = 4 # most ticks run in one frame when the simulation falls behind
+CHUNK_SIZE = 32 # the grid is simulated and redrawn by chunks of CHUNK_SIZE x CHUNK_SIZE cells
+SIMULATION_THREAD = False # simulate on a background thread, the window draws the last finished frame
+PARALLEL_SIMULATION = False # update the chunks on every core, in four checkerboard passes
+SIMULATION_THREADS = 0 # number of threads of the parallel simulation, 0 uses every core
+RANDOM_SEED = None # seed of the world's random stream, None gives a different world every run
+RANDOM_BLOCK_SIZE = 4096 # random numbers are drawn this many at a time
+CELL_LIST_CAPACITY = 16384 # cells the fire and burning wood lists hold before they grow
+PROFILER_FRAMES = 60 # the profiler overlay shows the mean of this many frames
+SNAPSHOT_PATH = "sandbox.npz" # where F5 saves the world and F9 loads it from
+RECORDING_PATH = "recording.json" # where F6 records the brush strokes, the world is saved next to it
 
 GRAVITY = 0.2
 FRICTION = 0.02
@@ -35,6 +52,7 @@ current_material = SAND_ID  # Start with sand
 simulation_is_on = True
 frame_count = 0
 MAX_SPREAD_DIST = 4 # water
+MAX_STEP = 15 # furthest a particle can fall in one frame, the parallel update needs CHUNK_SIZE >= 2 * (MAX_STEP + 1)
 BURNING_SPREAD_PROBABILITY = 0.01
 BURNING_WOOD_LIFESPAN = 80
 SPAWN_FIRE_PROBABILITY = 0.3 #probability of making a fire particle when burning wood
@@ -110,6 +128,7 @@ SMOKE_COLORS = [
 ]
 
 EMPTY_COLOR = (0, 0, 0)
-CHROMATIC_SPEED = 1
-CHROMATIC_PALETTE = utils.generate_palette(CHROMATIC_COLORS)
+CHROMATIC_SPEED = 25 # chromatic colors the rainbow moves by each second
+CHROMATIC_STEPS = 32 # colors between two CHROMATIC_COLORS, every color of every material must fit in 256
+CHROMATIC_PALETTE = utils.generate_palette(CHROMATIC_COLORS, CHROMATIC_STEPS)
 palette_size = len(CHROMATIC_PALETTE)
@@ -0,0 +1,115 @@
+"""Runs the sandbox without a window, a display or the UI.
+
+The world is built and painted from code and stepped as fast as the CPU allows,
+for servers, tests and benchmarks. From the command line:
+
+    python headless.py --frames 600 --width 250 --height 150 --paint sand:125,10,8 --paint water:60,20,6
+"""
+import argparse
+import time
+import numpy as np
+import pygame
+import bands
+import config
+import materials
+import paging
+import particle_system
+import snapshot
+
+MATERIALS = {name.replace(" ", "_"): material for material, name in enumerate(materials.MATERIAL_NAMES) if name}
+
+
+def new_world(width: int = config.GRID_WIDTH, height: int = config.GRID_HEIGHT, seed=config.RANDOM_SEED):
+    particle_system.initialize_grid(width, height, seed)
+
+
+def paint(material: int, x: int, y: int, radius: int = 0):
+    """Same as a left click with the brush at (x, y), returns the number of cells filled."""
+    return particle_system.spawn_stroke(material, x, y, x, y, radius)
+
+
+def erase(x: int, y: int, radius: int = 0):
+    """Same as a right click with the brush at (x, y), returns the number of cells emptied."""
+    return particle_system.erase_stroke(x, y, x, y, radius)
+
+
+def stroke(material: int, x0: int, y0: int, x1: int, y1: int, radius: int = 0):
+    """Drags the brush from (x0, y0) to (x1, y1) like main.py does, EMPTY_ID erases."""
+    return particle_system.brush_stroke(material, x0, y0, x1, y1, radius, config.random_velocity)
+
+
+def run(frames: int, render: bool = False):
+    """Steps the simulation frames times, returns the elapsed seconds.
+
+    With render the frames are also drawn, into an off screen surface.
+    """
+    target = pygame.Surface((config.SCREEN_WIDTH, config.WINDOW_HEIGHT)) if render else None
+    start = time.perf_counter()
+    for _ in range(frames):
+        particle_system.step()
+        if render:
+            particle_system.draw_grid(target)
+            particle_system.cycle_colors(config.CHROMATIC_PALETTE, config.palette_size, config.frame_count / config.FPS_LIMIT)
+        paging.update()
+        config.frame_count += 1
+    return time.perf_counter() - start
+
+
+def material_counts():
+    """Number of cells of each material, indexed by material id."""
+    counts = np.bincount(particle_system.grid.ravel(), minlength=materials.MATERIAL_COUNT)
+    paging.mark_all_loaded()
+    return counts
+
+
+def _parse_paint(text: str):
+    name, _, position = text.partition(":")
+    x, y, radius = (int(value) for value in position.split(","))
+    return MATERIALS[name], x, y, radius
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the sandbox without a window.")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=config.GRID_WIDTH)
+    parser.add_argument("--height", type=int, default=config.GRID_HEIGHT)
+    parser.add_argument("--paint", type=_parse_paint, action="append", default=[], metavar="MATERIAL:X,Y,RADIUS",
+                        help="brush applied before the first frame, can be repeated")
+    parser.add_argument("--seed", type=int, default=config.RANDOM_SEED)
+    parser.add_argument("--load", help="snapshot to start from instead of an empty world")
+    parser.add_argument("--save", help="file to save the world to after the last frame")
+    parser.add_argument("--render", action="store_true", help="also draw every frame, off screen")
+    parser.add_argument("--workers", type=int, default=0, help="update the particles in this many processes, see bands.py")
+    parser.add_argument("--page-dir", help="keep the world in memory-mapped files in this directory, see paging.py")
+    parser.add_argument("--memory-mb", type=float, default=config.PAGED_WORLD_BUDGET_MB,
+                        help="memory the rows of a paged world may use")
+    args = parser.parse_args()
+    if args.page_dir and args.workers:
+        parser.error("--page-dir and --workers can't be used together")
+
+    new_world(args.width, args.height, args.seed)
+    particle_system.update_particles()  # warm-up for jit functions
+    if args.load:
+        snapshot.load(args.load)
+    for material, x, y, radius in args.paint:
+        if material == config.EMPTY_ID:
+            erase(x, y, radius)
+        else:
+            paint(material, x, y, radius)
+    if args.page_dir:
+        paging.start(args.page_dir, args.memory_mb)
+    if args.workers:
+        bands.start(args.workers)
+    seconds = run(args.frames, args.render)
+    bands.stop()
+    paging.stop()
+    if args.save:
+        snapshot.save(args.save)
+    print(f"{args.frames} frames in {seconds:.3f}s ({args.frames / max(seconds, 1e-9):.1f} fps)")
+    for name, material in MATERIALS.items():
+        if material != config.EMPTY_ID:
+            print(f"{name}: {material_counts()[material]}")
+
+
+if __name__ == "__main__":
+    main()
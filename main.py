@@ -1,42 +1,50 @@
 import pygame
 import sys
-import random
 import os
+import camera
 import config
 import ui_elements
 import particle_system
+import paging
+import profiler
+import snapshot
+import recording
+import simulation_thread
+import timestep
 import utils
 
 pygame.init()
 screen = pygame.display.set_mode((config.WINDOW_WIDTH, config.WINDOW_HEIGHT))
-particle_system.initialize_grid()
+particle_system.initialize_grid(config.WORLD_WIDTH, config.WORLD_HEIGHT)
+if config.PAGED_WORLD_PATH:
+    paging.start(config.PAGED_WORLD_PATH, config.PAGED_WORLD_BUDGET_MB)
 pygame.display.set_caption("Sandbox")
 clock = pygame.time.Clock()
 ui_elements.init_ui(screen)
 
-CHROMATIC_PALETTE = utils.generate_palette(config.CHROMATIC_COLORS)
-palette_size = len(CHROMATIC_PALETTE)
+CHROMATIC_PALETTE = config.CHROMATIC_PALETTE
+palette_size = config.palette_size
 # warm-up for jit functions
-particle_system.apply_gravity(1.0, 1.0, 10.0, 10.0, 1.0)
+particle_system.apply_gravity(1.0, 1.0, 10.0, 10.0, 1.0, 0.02)
+particle_system.update_particles()
 utils.get_line(0, 0, 0, 0)
 utils.get_shuffled_tab([1, 2])
 
 if config.ANNIVERSAIRE:
-    tab = utils.get_text_pixels_pygame("HAPPY", config.GRID_WIDTH, config.GRID_HEIGHT, 0.6)
+    tab = utils.get_text_pixels_pygame("HAPPY", camera.view_size()[0], camera.view_size()[1], 0.6)
     for (x, y) in tab:
-        p = particle_system.Particle(config.CHROMATIC_ID, x, y, random.choice(config.CHROMATIC_COLORS))
-        particle_system.grid[y][x] = p
-        particle_system.chromatic_particles.add(p)
-    tab = utils.get_text_pixels_pygame("BIRTHDAY", config.GRID_WIDTH, config.GRID_HEIGHT, 1.4)
+        particle_system.create_particle(config.CHROMATIC_ID, x, y)
+    tab = utils.get_text_pixels_pygame("BIRTHDAY", camera.view_size()[0], camera.view_size()[1], 1.4)
     for (x, y) in tab:
-        p = particle_system.Particle(config.CHROMATIC_ID, x, y, random.choice(config.CHROMATIC_COLORS))
-        particle_system.grid[y][x] = p
-        particle_system.chromatic_particles.add(p)
+        particle_system.create_particle(config.CHROMATIC_ID, x, y)
 
 fps_font = pygame.font.SysFont("Arial", 24, bold=True)
 def fps_counter():
+    if profiler.enabled:
+        profiler.draw(screen, clock.get_fps(), timestep.tick_rate(), config.SCREEN_WIDTH + 10, 475)  # under the buttons
+        return
     fps = str(int(clock.get_fps()))
-    fps_t = fps_font.render(f'fps: {fps}', 1, pygame.Color("RED"))
+    fps_t = fps_font.render(f'fps: {fps}  ticks/s: {timestep.tick_rate()}', 1, pygame.Color("RED"))
     screen.blit(fps_t, (config.SCREEN_WIDTH + 10, 565))
 
 
@@ -91,15 +99,19 @@ def toggle_simulation_callback():
         ui_elements.pause_button.pressedColour = (180, 40, 50)
 
 
+def clear_world():
+    particle_system.clear_world()
+    recording.record_clear()
+
+
 def clear_screen():
-    particle_system.active_particles.clear()
-    particle_system.particles_to_clear.clear()
-    particle_system.particles_to_draw.clear()
-    particle_system.chromatic_particles.clear()
-    particle_system.active_smoke_particles.clear()
-    particle_system.fire_particles.clear()
-    particle_system.burning_wood.clear()
-    particle_system.initialize_grid()
+    simulation_thread.submit(clear_world)
+
+
+def load_snapshot():
+    if recording.current is not None:  # the recording can't follow a load
+        recording.stop()
+    snapshot.load(config.SNAPSHOT_PATH)
 
 
 def update_brush_size_from_slider_callback(value):
@@ -117,25 +129,17 @@ ui_elements.wood_button.onClick = set_wood_material_callback
 ui_elements.acid_button.onClick = set_acid_material_callback
 ui_elements.pause_button.onClick = toggle_simulation_callback
 ui_elements.clear_button.onClick = clear_screen
+ui_elements.profiler_button.onClick = profiler.toggle
+
+if config.SIMULATION_THREAD:
+    simulation_thread.start()
 
 prev_pos = None
 running = True
 while running:
-    if config.simulation_is_on:
-        #print("--- Start of Frame ---")
-        #print(f"fire_particles count before update_particles: {len(particle_system.fire_particles)}")
-        particle_system.update_acid_particles()
-        particle_system.update_particles()
-        #print(f"fire_particles count after update_particles: {len(particle_system.fire_particles)}")
-        #print(f"fire_particles count before update_steam_particles: {len(particle_system.fire_particles)}")
-        particle_system.update_smoke_particles()
-        #print(f"fire_particles count after update_steam_particles: {len(particle_system.fire_particles)}")
-        #print(f"fire_particles count before update_fire_particles: {len(particle_system.fire_particles)}")
-        particle_system.update_fire_particles()
-        #print(f"fire_particles count AFTER update_fire_particles: {len(particle_system.fire_particles)}")
-        #print(particle_system.fire_particles)
-        particle_system.update_burning_wood()
-        
+    if simulation_thread.thread is None:
+        simulation_thread.simulate_frame()
+
     mouse_pos = pygame.mouse.get_pos()
     events = pygame.event.get()
     for event in events:
@@ -143,142 +147,54 @@ while running:
             running = False
         if event.type == pygame.USEREVENT:
             pass
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            profiler.toggle()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+            simulation_thread.submit(snapshot.save, config.SNAPSHOT_PATH)
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F9 and os.path.exists(config.SNAPSHOT_PATH):
+            simulation_thread.submit(load_snapshot)
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F6:
+            simulation_thread.submit(recording.toggle, config.RECORDING_PATH)
+        if event.type == pygame.MOUSEWHEEL and mouse_pos[0] < config.SCREEN_WIDTH:
+            camera.zoom_at(event.y, *mouse_pos)
+    # Camera: arrow keys or the middle button
+    keys = pygame.key.get_pressed()
+    pan = config.CAMERA_PAN_SPEED / max(clock.get_fps(), 1)
+    camera.pan((keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * pan, (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * pan)
+    drag_x, drag_y = pygame.mouse.get_rel()
+    if pygame.mouse.get_pressed()[1]:
+        camera.pan(-drag_x, -drag_y)
     # Mouse actions
     mouse_buttons = pygame.mouse.get_pressed()
     if any(mouse_buttons):
-        mx, my = pygame.mouse.get_pos()
-        gx, gy = mx // config.CELL_SIZE, my // config.CELL_SIZE
-        if 0 <= gx < config.GRID_WIDTH and 0 <= gy < config.GRID_HEIGHT:
+        cell = camera.screen_to_cell(*pygame.mouse.get_pos())
+        if cell is not None:
+            gx, gy = cell
             if prev_pos != None:
-                for x, y in utils.get_line(prev_pos[0], prev_pos[1], gx, gy):
-                    if config.random_velocity:
-                        vx = random.randint(-5, 5)
-                        vy = random.randint(-5, 5)
-                    if mouse_buttons[0]:  # Left click // Sand
-                        if config.current_material == config.SAND_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if config.RANDOM_SPAWN_PROBABILITY >= random.random():
-                                            if particle_system.grid[ny][nx] is None:
-                                                p = particle_system.Particle(config.SAND_ID, nx, ny, random.choice(config.SAND_COLORS))
-                                                if config.random_velocity:
-                                                    p.vx = vx
-                                                    p.vy = vy
-                                                particle_system.grid[ny][nx] = p
-                                                particle_system.active_particles.add(p)
-                                                particle_system.particles_to_draw.add(p)
-
-                        elif config.current_material == config.WATER_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if config.RANDOM_SPAWN_PROBABILITY >= random.random():
-                                            if particle_system.grid[ny][nx] is None:
-                                                p = particle_system.Particle(config.WATER_ID, nx, ny, random.choice(config.WATER_COLORS))
-                                                if config.random_velocity:
-                                                    p.vx = vx
-                                                    p.vy = vy
-                                                particle_system.grid[ny][nx] = p
-                                                particle_system.active_particles.add(p)
-                                                particle_system.particles_to_draw.add(p)
-
-                        elif config.current_material == config.STONE_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if particle_system.grid[ny][nx] is None:
-                                            p = particle_system.Particle(config.STONE_ID, nx, ny, random.choice(config.STONE_COLORS))
-                                            particle_system.grid[ny][nx] = p
-                                            particle_system.particles_to_draw.add(p)
-
-                        elif config.current_material == config.CHROMATIC_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if particle_system.grid[ny][nx] is None:
-                                            p = particle_system.Particle(config.CHROMATIC_ID, nx, ny, random.choice(config.CHROMATIC_COLORS))
-                                            particle_system.grid[ny][nx] = p
-                                            particle_system.chromatic_particles.add(p)
-                        
-                        elif config.current_material == config.WOOD_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if particle_system.grid[ny][nx] is None:
-                                            p = particle_system.Particle(config.WOOD_ID, nx, ny, random.choice(config.WOOD_COLORS))
-                                            particle_system.grid[ny][nx] = p
-                                            particle_system.particles_to_draw.add(p)
-
-                        elif config.current_material == config.STEAM_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if config.RANDOM_SPAWN_PROBABILITY >= random.random():
-                                            if particle_system.grid[ny][nx] is None:
-                                                p = particle_system.Particle(config.STEAM_ID, nx, ny, random.choice(config.STEAM_COLORS))
-                                                particle_system.grid[ny][nx] = p
-                                                particle_system.active_smoke_particles.add(p)
-                                                particle_system.particles_to_draw.add(p)
-
-                        elif config.current_material == config.FIRE_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if particle_system.grid[ny][nx] is None:
-                                            p = particle_system.Particle(config.FIRE_ID, nx, ny, random.choice(config.FIRE_COLORS))
-                                            p.lifespan = config.FIRE_LIFESPAN + random.randint(-config.FIRE_LIFESPAN_VARIATION, config.FIRE_LIFESPAN_VARIATION)
-                                            particle_system.grid[ny][nx] = p
-                                            particle_system.fire_particles.add(p)
-                                            particle_system.particles_to_draw.add(p)
-                        
-                        elif config.current_material == config.ACID_ID:
-                            for dx in range(-spawn_radius, spawn_radius+1):
-                                for dy in range(-spawn_radius, spawn_radius+1):
-                                    nx, ny = x + dx, y + dy
-                                    if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                        if particle_system.grid[ny][nx] is None:
-                                            p = particle_system.Particle(config.ACID_ID, nx, ny, random.choice(config.ACID_COLORS))
-                                            particle_system.grid[ny][nx] = p
-                                            particle_system.active_particles.add(p)
-                                            particle_system.acid_particles.add(p)
-                                            particle_system.particles_to_draw.add(p)
-
-                    elif mouse_buttons[2]:  # Right click // Air
-                        for dx in range(-spawn_radius, spawn_radius+1):
-                            for dy in range(-spawn_radius, spawn_radius+1):
-                                nx, ny = x + dx, y + dy
-                                if 0 <= nx < config.GRID_WIDTH and 0 <= ny < config.GRID_HEIGHT:
-                                    p = particle_system.grid[ny][nx]
-                                    if p is not None:
-                                        particle_system.active_particles.discard(p)
-                                        particle_system.grid[ny][nx] = None
-                                        particle_system.particles_to_clear.add((nx, ny))
-                                        particle_system.particles_to_draw.discard(p)
-                                        particle_system.chromatic_particles.discard(p)
-                                        particle_system.active_smoke_particles.discard(p)
-                                        particle_system.fire_particles.discard(p)
-                                        particle_system.update_near_particles(nx, ny)
-        prev_pos = (gx, gy)
+                if mouse_buttons[0] or mouse_buttons[2]:
+                    material = config.current_material if mouse_buttons[0] else config.EMPTY_ID
+                    simulation_thread.submit(recording.record_stroke, material, spawn_radius, prev_pos[0], prev_pos[1], gx, gy)
+                    simulation_thread.submit(particle_system.brush_stroke, material, prev_pos[0], prev_pos[1], gx, gy,
+                                             spawn_radius, config.random_velocity)
+        prev_pos = cell
     else:
         prev_pos = None 
     
-    particle_system.draw_grid(screen)
+    if profiler.enabled:
+        for name, value in particle_system.activity_sizes().items():
+            profiler.set_size(name, value)
+    profiler.measure("draw_grid", simulation_thread.draw, screen)
     pygame.draw.rect(screen, (30, 30, 30), (config.WINDOW_WIDTH - config.TOOLBAR_WIDTH, 0, config.TOOLBAR_WIDTH, config.WINDOW_HEIGHT))
-    ui_elements.pygame_widgets.update(events)
-    particle_system.cycle_colors(CHROMATIC_PALETTE, palette_size)
+    profiler.measure("widgets", ui_elements.pygame_widgets.update, events)
+    profiler.measure("cycle_colors", particle_system.cycle_colors, CHROMATIC_PALETTE, palette_size)
     if ui_elements.brush_slider != None:
         spawn_radius = ui_elements.brush_slider.getValue()
         ui_elements.brush_size_label.setText(f"Brush Size: {spawn_radius}")
     fps_counter()
-    pygame.display.flip()
-    clock.tick(60)
+    profiler.measure("flip", pygame.display.flip)
+    clock.tick(config.FPS_LIMIT)
     config.frame_count += 1
+simulation_thread.stop()
+if recording.current is not None:
+    recording.stop()
 pygame.quit()
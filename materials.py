@@ -0,0 +1,86 @@
+"""Every material and its properties, in one table.
+
+The table is turned into arrays indexed by material id: MATERIAL_FLAGS holds the
+flags below as bits, DENSITY the densities. The jitted kernels get both through
+MATERIAL_TABLES, the Python code reads the flags from the FLAGS list. Adding a
+material is one id in config.py, its colors, and one entry here.
+"""
+import numpy as np
+from config import *
+
+SOLID = 1  # never moves, stops gases and diagonal slides
+POWDER = 2  # falls and piles up
+LIQUID = 4  # falls and spreads sideways
+GAS = 8  # rises, the falling materials go through it
+FLAMMABLE = 16  # fire sets it on fire
+CORRODIBLE = 32  # acid dissolves it
+SPARSE_BRUSH = 64  # the brush only fills RANDOM_SPAWN_PROBABILITY of the cells
+
+# a falling material sinks into a liquid or gas of lower density, lifespan is the
+# number of frames a new cell lives, give or take lifespan_variation (0 lives forever)
+MATERIALS = {
+    EMPTY_ID: {"name": "empty", "colors": [EMPTY_COLOR], "flags": 0, "density": 0.0},
+    SAND_ID: {"name": "sand", "colors": SAND_COLORS, "flags": POWDER | CORRODIBLE | SPARSE_BRUSH, "density": 1.6},
+    WATER_ID: {"name": "water", "colors": WATER_COLORS, "flags": LIQUID | CORRODIBLE | SPARSE_BRUSH, "density": 1.0},
+    STONE_ID: {"name": "stone", "colors": STONE_COLORS, "flags": SOLID | CORRODIBLE, "density": 2.5},
+    CHROMATIC_ID: {"name": "chromatic", "colors": CHROMATIC_PALETTE, "flags": SOLID | CORRODIBLE, "density": 2.5},
+    STEAM_ID: {"name": "steam", "colors": STEAM_COLORS, "flags": GAS | CORRODIBLE | SPARSE_BRUSH, "density": 0.0006},
+    FIRE_ID: {"name": "fire", "colors": FIRE_COLORS, "flags": CORRODIBLE, "density": 0.0003,
+              "lifespan": FIRE_LIFESPAN, "lifespan_variation": FIRE_LIFESPAN_VARIATION},
+    WOOD_ID: {"name": "wood", "colors": WOOD_COLORS, "flags": SOLID | FLAMMABLE | CORRODIBLE, "density": 0.7},
+    BURNING_WOOD_ID: {"name": "burning wood", "colors": BURNING_WOOD_COLORS, "flags": SOLID | CORRODIBLE, "density": 0.7,
+                      "lifespan": BURNING_WOOD_LIFESPAN},
+    SMOKE_ID: {"name": "smoke", "colors": SMOKE_COLORS, "flags": GAS | CORRODIBLE, "density": 0.001},
+    ACID_ID: {"name": "acid", "colors": ACID_COLORS, "flags": LIQUID, "density": 1.0},
+}
+MATERIAL_COUNT = max(MATERIALS) + 1
+
+MATERIAL_FLAGS = np.zeros(MATERIAL_COUNT, dtype=np.uint16)
+DENSITY = np.zeros(MATERIAL_COUNT, dtype=np.float64)
+MATERIAL_NAMES = [""] * MATERIAL_COUNT
+LIFESPANS = [0] * MATERIAL_COUNT
+LIFESPAN_VARIATIONS = [0] * MATERIAL_COUNT
+# every color a cell can have, cells only store an index into this table, which is
+# also the palette of the 8 bit surfaces the world is drawn into
+PALETTE = []
+COLOR_OFFSETS = [0] * MATERIAL_COUNT  # first palette index of each material
+COLOR_COUNTS = [0] * MATERIAL_COUNT  # number of colors of each material
+for material_id, material in MATERIALS.items():
+    MATERIAL_FLAGS[material_id] = material["flags"]
+    DENSITY[material_id] = material["density"]
+    MATERIAL_NAMES[material_id] = material["name"]
+    LIFESPANS[material_id] = material.get("lifespan", 0)
+    LIFESPAN_VARIATIONS[material_id] = material.get("lifespan_variation", 0)
+    COLOR_OFFSETS[material_id] = len(PALETTE)
+    COLOR_COUNTS[material_id] = len(material["colors"])
+    PALETTE += material["colors"]
+if len(PALETTE) > 256:
+    raise ValueError(f"the materials have {len(PALETTE)} colors, the renderer draws with an 8 bit palette of 256")
+
+# what the jitted kernels get
+MATERIAL_TABLES = (MATERIAL_FLAGS, DENSITY, np.array(COLOR_OFFSETS, dtype=np.uint16), np.array(COLOR_COUNTS, dtype=np.uint16),
+                   np.array(LIFESPANS, dtype=np.int32), np.array(LIFESPAN_VARIATIONS, dtype=np.int32))
+FLAGS = MATERIAL_FLAGS.tolist()  # a list is faster to index from Python than an array
+
+
+def materials_with(flag: int):
+    """Ids of the materials that have flag."""
+    return [material_id for material_id in MATERIALS if MATERIAL_FLAGS[material_id] & flag]
+
+
+# (a, b, probability, a becomes, b becomes): what happens each frame when a cell of
+# material a is next to a cell of material b, see particle_system.update_reactions
+REACTIONS = [
+    (FIRE_ID, WATER_ID, 1.0, STEAM_ID, STEAM_ID),
+    (FIRE_ID, WOOD_ID, 1.0, EMPTY_ID, BURNING_WOOD_ID),
+    (BURNING_WOOD_ID, WATER_ID, 1.0, WOOD_ID, STEAM_ID),
+    (BURNING_WOOD_ID, WOOD_ID, BURNING_SPREAD_PROBABILITY, BURNING_WOOD_ID, BURNING_WOOD_ID),
+] + [(ACID_ID, material_id, 1.0, EMPTY_ID, EMPTY_ID) for material_id in materials_with(CORRODIBLE)]
+
+REACTION_PROBABILITY = np.zeros((MATERIAL_COUNT, MATERIAL_COUNT), dtype=np.float64)
+REACTION_RESULTS = np.zeros((MATERIAL_COUNT, MATERIAL_COUNT, 2), dtype=np.uint8)
+for a, b, probability, result_a, result_b in REACTIONS:
+    REACTION_PROBABILITY[a, b] = probability
+    REACTION_RESULTS[a, b] = result_a, result_b
+REACTIVE = (REACTION_PROBABILITY > 0).any(axis=1)  # materials that react with something
+REACTION_TABLES = (REACTION_PROBABILITY, REACTION_RESULTS, REACTIVE)
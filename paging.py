@@ -0,0 +1,115 @@
+"""Keeps the cells of a big world on disk and only the rows in use in memory.
+
+Every per cell array of the world becomes a memory-mapped .npy file in a
+directory. The operating system loads the rows of a file when a kernel or the
+camera touches them, and update() hands back the memory of the chunk rows
+nobody used lately as soon as more than the budget is loaded. The rows are
+saved in the file, the next access reads them back. Arrays are stored row by
+row, so memory is given back by whole chunk rows (CHUNK_SIZE rows of the full
+width). Giving memory back uses madvise, which only Linux has; elsewhere the
+world still lives in the files but its rows stay in memory once loaded.
+"""
+import mmap
+import os
+import numpy as np
+import camera
+import particle_system
+from config import *
+
+PAGED_ARRAYS = ("grid", "grid_color", "grid_vx", "grid_vy", "grid_tx", "grid_ty", "grid_lifespan", "updated_tick",
+                "redraw_cells", "changed_cells", "previous_grid", "kept_cells", "woken_cells")
+
+_directory = None
+_budget_rows = 0  # chunk rows allowed in memory
+_arrays = {}  # name -> array over the mapping of its file, what particle_system uses
+_mappings = {}  # name -> (mmap of the whole file, offset of the cells in it)
+last_used = None  # tick every chunk row was last awake or in view
+loaded = None  # chunk rows that may be in memory
+
+
+def start(directory: str, budget_mb: float):
+    """Moves the current world into memory-mapped files in directory, keeping about budget_mb of it in memory."""
+    global _directory, _budget_rows
+    if particle_system.band_update is not None:
+        raise ValueError("a paged world can't be shared with bands.py workers")
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _page_world()
+    row_bytes = CHUNK_SIZE * sum(array.strides[0] for array in _arrays.values())
+    _budget_rows = max(int(budget_mb * 2 ** 20 // row_bytes), 1)
+    update()  # the copy loaded every row, see _page_world
+
+
+def _page_world():
+    """Copies the world arrays into the files and points particle_system at them."""
+    global last_used, loaded
+    _arrays.clear()
+    _mappings.clear()
+    for name in PAGED_ARRAYS:
+        array = getattr(particle_system, name)
+        with open(os.path.join(_directory, name + ".npy"), "w+b") as file:
+            np.lib.format.write_array_header_1_0(file, np.lib.format.header_data_from_array_1_0(array))
+            offset = file.tell()
+            file.truncate(offset + array.nbytes)
+            mapping = mmap.mmap(file.fileno(), 0)  # keeps its own handle on the file
+        _mappings[name] = (mapping, offset)
+        _arrays[name] = np.ndarray(array.shape, array.dtype, buffer=mapping, offset=offset)
+        _arrays[name][...] = array
+        setattr(particle_system, name, _arrays[name])
+    chunks_y = (particle_system.GRID_HEIGHT + CHUNK_SIZE - 1) // CHUNK_SIZE
+    last_used = np.zeros(chunks_y, dtype=np.int64)
+    loaded = np.ones(chunks_y, dtype=bool)
+
+
+def _unload(cy: int):
+    """Gives back the memory of the chunk row cy, its cells stay in the files."""
+    loaded[cy] = False
+    if not hasattr(mmap, "MADV_DONTNEED"):  # not Linux, the rows stay in memory
+        return
+    for name, (mapping, offset) in _mappings.items():
+        row_bytes = CHUNK_SIZE * _arrays[name].strides[0]
+        start = offset + cy * row_bytes
+        end = min(start + row_bytes, len(mapping))
+        start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE  # only the pages inside the rows
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            mapping.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def mark_all_loaded():
+    """To call after reading or writing the whole world, so the next update() can unload the rows it loaded."""
+    if loaded is not None:
+        loaded[:] = True
+
+
+def update():
+    """To call once a frame: notes the chunk rows in use and unloads the oldest others while over the budget."""
+    if _directory is None:
+        return
+    if any(getattr(particle_system, name) is not _arrays[name] for name in PAGED_ARRAYS):  # a new world
+        _page_world()
+    used = particle_system.chunk_awake.any(axis=1)
+    used[1:] |= used[:-1].copy()  # particles read and move a little into the chunk rows around
+    used[:-1] |= used[1:].copy()
+    _, view_y0, _, view_y1 = camera.visible_rect()
+    used[view_y0 // CHUNK_SIZE:view_y1 // CHUNK_SIZE + 1] = True
+    last_used[used] = particle_system.tick
+    loaded[used] = True
+    over = np.count_nonzero(loaded) - _budget_rows
+    if over > 0:
+        idle = np.nonzero(loaded & ~used)[0]
+        for cy in idle[np.argsort(last_used[idle], kind="stable")][:over].tolist():
+            _unload(cy)
+
+
+def stop():
+    """Brings the world back into memory and stops paging, the files are left in the directory."""
+    global _directory
+    if _directory is None:
+        return
+    for name in PAGED_ARRAYS:
+        if getattr(particle_system, name) is _arrays[name]:
+            setattr(particle_system, name, np.array(_arrays[name]))
+    _arrays.clear()
+    _mappings.clear()  # the mappings close once nothing uses their arrays
+    _directory = None
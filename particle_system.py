@@ -1,126 +1,404 @@
 import pygame
-import random
 import math
+import mmap
 import time
+from collections import namedtuple
+import numpy as np
+import camera
+import chunks
 from config import *
+from materials import *
 from utils import *
-from numba import jit
+from numba import jit, prange, set_num_threads
+
+
+# The world is stored as one array per field, indexed [y, x]. grid holds the
+# material id of every cell (EMPTY_ID for air), the other arrays only mean
+# something where grid is not empty.
+grid = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+grid_color = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)  # index in PALETTE
+grid_vx = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+grid_vy = np.ones((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+grid_tx = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+grid_ty = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+grid_lifespan = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.int32)
+updated_tick = np.full((GRID_HEIGHT, GRID_WIDTH), -1, dtype=np.int32)  # last tick a cell was moved into
+tick = 0
+
+# activity is tracked by chunks, see chunks.py
+chunk_changed = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)  # cells changed since the frame started
+chunk_redraw = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)  # cells to redraw
+chunk_rect = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)  # cells to simulate this frame
+chunk_awake = np.zeros(chunk_rect.shape[:2], dtype=np.uint8)
+redraw_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)  # per cell flags of the parallel update
+changed_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+# inside the awake chunks the gas, fire and burning wood kernels only visit the cells next to a change,
+# see _wake_cells_kernel
+previous_grid = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)  # grid as the last _wake_cells_kernel saw it
+kept_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)  # cells that asked to stay awake
+woken_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)  # cells to visit this frame
+woken_tick = -1  # tick woken_cells was worked out for
+# the fire and burning wood lists are filled into the same two arrays every tick,
+# they only grow (to twice the size) when a list doesn't fit, see cell_list
+cell_xs = np.empty(CELL_LIST_CAPACITY, dtype=np.int64)
+cell_ys = np.empty(CELL_LIST_CAPACITY, dtype=np.int64)
+cell_list_high_water = 0  # longest list so far
+cell_list_uses = 0
+cell_list_grows = 0
+NO_TIMER = np.iinfo(np.int32).max
+chunk_timer = np.full(chunk_awake.shape, NO_TIMER, dtype=np.int32)  # first tick a sleeping gas of the chunk is due
+parallel = PARALLEL_SIMULATION
+band_update = None  # set by bands.start(), runs the particle pass in worker processes
+
+# Every world has its own random stream, so the same seed and the same inputs give
+# the same frames. Python code reads it through next_random(), which hands out
+# numbers from a block drawn RANDOM_BLOCK_SIZE at a time. The jitted kernels get
+# one seed per frame and hash it with the cell position, see _cell_random.
+random_generator = np.random.default_rng(RANDOM_SEED)
+random_block = []
+random_index = 0
+PERMUTATIONS_3 = ((-1, 0, 1), (-1, 1, 0), (0, -1, 1), (0, 1, -1), (1, -1, 0), (1, 0, -1))
+
+# The settings of config.py the kernels use. They are handed to the kernels like
+# MATERIAL_TABLES, numba caches the kernels compiled and a global read in them
+# would keep the value it had back then.
+Physics = namedtuple("Physics", ("gravity", "friction", "max_step", "max_spread_dist", "fire_dies_probability",
+                                 "spawn_smoke_probability_fire", "spawn_fire_probability", "spawn_smoke_probability_wood",
+                                 "condense_probability", "steam_to_water_ratio", "smoke_dissipate_probability"))
+PHYSICS = Physics(float(GRAVITY), float(FRICTION), int(MAX_STEP), int(MAX_SPREAD_DIST), float(FIRE_DIES_PROBABILITY),
+                  float(SPAWN_SMOKE_PROBABILITY_FIRE), float(SPAWN_FIRE_PROBABILITY), float(SPAWN_SMOKE_PROBABILITY_WOOD),
+                  float(CONDENSE_PROBABILITY), float(STEAM_TO_WATER_RATIO), float(SMOKE_DISSIPATE_PROBABILITY))
+
+chromatic_shift = 0  # how far the chromatic colors of the palette are rotated, see cycle_colors
+drawn_view = None  # camera view screen_surface was last drawn for
 
 
 class Particle:
-    __slots__ = ('type', 'x', 'y', 'tx', 'ty', 'vx', 'vy', 'color', 'lifespan')
+    """Read-only view on one cell of the world, the data itself lives in the grid_* arrays."""
+    __slots__ = ('x', 'y')
 
-    def __init__(self, type, x, y, color):
-        self.type = type
+    def __init__(self, x, y):
         self.x = x
         self.y = y
-        self.tx = float(x)
-        self.ty = float(y)
-        self.vx = 0.0
-        self.vy = 1.0
-        self.color = color
-        self.lifespan = 0
+
+    @property
+    def type(self):
+        return int(grid[self.y, self.x])
+
+    @property
+    def color(self):
+        return PALETTE[grid_color[self.y, self.x]]
+
+    @property
+    def color_index(self):
+        return int(grid_color[self.y, self.x])
+
+    @property
+    def vx(self):
+        return float(grid_vx[self.y, self.x])
+
+    @property
+    def vy(self):
+        return float(grid_vy[self.y, self.x])
+
+    @property
+    def tx(self):
+        return float(grid_tx[self.y, self.x])
+
+    @property
+    def ty(self):
+        return float(grid_ty[self.y, self.x])
+
+    @property
+    def lifespan(self):
+        return int(grid_lifespan[self.y, self.x])
 
     def __repr__(self):
         return f"P(x:{self.x}, y:{self.y})"
 
 
-grid = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-active_particles = set()
-active_particles_copy = set()
-particles_to_clear = set()
-particles_to_draw = set()
-chromatic_particles = set()
-active_smoke_particles = set()
-fire_particles = set()
-burning_wood = set()
-acid_particles = set()
+def get_particle(x: int, y: int):
+    """View on the particle at (x, y), None for an empty cell. Changes go through create_particle and the brush."""
+    if grid[y, x] == EMPTY_ID:
+        return None
+    return Particle(x, y)
+
+
+def seed_random(seed=None):
+    """Restarts the random stream of the world, seed None takes a fresh one from the OS."""
+    global random_generator, random_block, random_index
+    random_generator = np.random.default_rng(seed)
+    random_block = []
+    random_index = 0
+
+
+def next_random():
+    """Next number in [0, 1) of the world's random stream."""
+    global random_block, random_index
+    if random_index == len(random_block):
+        random_block = random_generator.random(RANDOM_BLOCK_SIZE).tolist()
+        random_index = 0
+    random_index += 1
+    return random_block[random_index - 1]
+
+
+def random_int(low: int, high: int):
+    """Random integer between low and high, both included."""
+    return low + int(next_random() * (high - low + 1))
+
+
+def random_array(count: int):
+    """count numbers in [0, 1) of the world's random stream, drawn at once."""
+    return random_generator.random(count)
+
+
+def random_color(type: int):
+    return COLOR_OFFSETS[type] + int(next_random() * COLOR_COUNTS[type])
+
+
+def random_lifespan(type: int):
+    if LIFESPAN_VARIATIONS[type] == 0:
+        return LIFESPANS[type]
+    return LIFESPANS[type] + random_int(-LIFESPAN_VARIATIONS[type], LIFESPAN_VARIATIONS[type])
+
+
+def create_particle(type: int, x: int, y: int):
+    grid[y, x] = type
+    grid_color[y, x] = random_color(type)
+    grid_vx[y, x] = 0.0
+    grid_vy[y, x] = 1.0
+    grid_tx[y, x] = x
+    grid_ty[y, x] = y
+    grid_lifespan[y, x] = random_lifespan(type)
+    chunks.mark_changed(chunk_redraw, chunk_changed, x, y, CHUNK_SIZE)
+
+
+def stroke_cells(x0: int, y0: int, x1: int, y1: int, radius: int):
+    """(xs, ys) of the cells covered by the brush dragged from (x0, y0) to (x1, y1), each cell once.
+
+    The brush is a square of side 2 * radius + 1 centered on every point of the line.
+    """
+    left, top = max(min(x0, x1) - radius, 0), max(min(y0, y1) - radius, 0)
+    right, bottom = min(max(x0, x1) + radius, GRID_WIDTH - 1), min(max(y0, y1) + radius, GRID_HEIGHT - 1)
+    if left > right or top > bottom:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    covered = np.zeros((bottom - top + 1, right - left + 1), dtype=np.bool_)
+    for x, y in get_line(x0, y0, x1, y1):
+        covered[max(y - radius - top, 0):max(y + radius + 1 - top, 0), max(x - radius - left, 0):max(x + radius + 1 - left, 0)] = True
+    ys, xs = np.nonzero(covered)
+    return xs + left, ys + top
+
+
+def spawn_stroke(type: int, x0: int, y0: int, x1: int, y1: int, radius: int = 0, velocity=None):
+    """Fills the empty cells under a brush stroke with type, returns how many were filled.
+
+    SPARSE_BRUSH materials only fill RANDOM_SPAWN_PROBABILITY of the cells. velocity
+    (vx, vy) is given to the falling materials.
+    """
+    xs, ys = stroke_cells(x0, y0, x1, y1, radius)
+    keep = grid[ys, xs] == EMPTY_ID
+    if FLAGS[type] & SPARSE_BRUSH:
+        keep &= random_array(len(xs)) <= RANDOM_SPAWN_PROBABILITY
+    xs, ys = xs[keep], ys[keep]
+    grid[ys, xs] = type
+    grid_color[ys, xs] = COLOR_OFFSETS[type] + (random_array(len(xs)) * COLOR_COUNTS[type]).astype(np.uint8)
+    grid_vx[ys, xs], grid_vy[ys, xs] = 0.0, 1.0
+    if velocity is not None and FLAGS[type] & (POWDER | LIQUID):
+        grid_vx[ys, xs], grid_vy[ys, xs] = velocity
+    grid_tx[ys, xs], grid_ty[ys, xs] = xs, ys
+    grid_lifespan[ys, xs] = LIFESPANS[type]
+    if LIFESPAN_VARIATIONS[type]:
+        variation = (random_array(len(xs)) * (2 * LIFESPAN_VARIATIONS[type] + 1)).astype(np.int32)
+        grid_lifespan[ys, xs] += variation - LIFESPAN_VARIATIONS[type]
+    chunks.mark_cells(chunk_redraw, chunk_changed, xs, ys, CHUNK_SIZE)
+    return len(xs)
+
+
+def erase_stroke(x0: int, y0: int, x1: int, y1: int, radius: int = 0):
+    """Empties every cell under a brush stroke, returns how many were emptied."""
+    xs, ys = stroke_cells(x0, y0, x1, y1, radius)
+    types = grid[ys, xs]
+    xs, ys = xs[types != EMPTY_ID], ys[types != EMPTY_ID]
+    grid[ys, xs] = EMPTY_ID
+    chunks.mark_cells(chunk_redraw, chunk_changed, xs, ys, CHUNK_SIZE)
+    return len(xs)
+
+
+def brush_stroke(type: int, x0: int, y0: int, x1: int, y1: int, radius: int = 0, random_velocity: bool = False):
+    """What dragging the mouse does: erases for EMPTY_ID, else spawns type, with one random velocity if asked."""
+    if type == EMPTY_ID:
+        return erase_stroke(x0, y0, x1, y1, radius)
+    velocity = (random_int(-5, 5), random_int(-5, 5)) if random_velocity else None
+    return spawn_stroke(type, x0, y0, x1, y1, radius, velocity)
+
+
+def world_arrays():
+    """The world arrays, their change tracking and CHUNK_SIZE as one tuple, this is how they are handed to the jitted kernels."""
+    return (grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, chunk_redraw, chunk_changed, CHUNK_SIZE)
+
+
+def wake_cells():
+    """Works out woken_cells on the first call of a frame, so the changes made by the stages before it count too."""
+    global woken_tick
+    if woken_tick != tick:
+        _wake_cells_kernel(grid, previous_grid, kept_cells, woken_cells, chunk_awake, chunk_rect)
+        woken_tick = tick
 
 
-def initialize_grid():
-    global grid, grid_surface
-    grid = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    grid_surface = pygame.Surface(
-        (GRID_WIDTH * CELL_SIZE, GRID_HEIGHT * CELL_SIZE)).convert()
-    grid_surface.fill(EMPTY_COLOR)
+def cell_list(type: int):
+    """The xs, ys of the woken cells of type, chunk by chunk and row by row, as views on cell_xs and cell_ys."""
+    global cell_xs, cell_ys, cell_list_high_water, cell_list_uses, cell_list_grows
+    wake_cells()
+    count = _woken_cells_of(grid, woken_cells, chunk_awake, chunk_rect, type, cell_xs, cell_ys)
+    if count > len(cell_xs):
+        cell_xs = np.empty(max(count, 2 * len(cell_xs)), dtype=np.int64)
+        cell_ys = np.empty(len(cell_xs), dtype=np.int64)
+        _woken_cells_of(grid, woken_cells, chunk_awake, chunk_rect, type, cell_xs, cell_ys)
+        cell_list_grows += 1
+    cell_list_uses += 1
+    cell_list_high_water = max(cell_list_high_water, count)
+    return cell_xs[:count], cell_ys[:count]
+
+
+def activity_sizes():
+    """How much of the world is being worked on, shown by the profiler."""
+    sizes = {
+        "awake chunks": int(np.count_nonzero(chunk_awake)),
+        "redraw rects": len(chunks.rects_in_use(chunk_redraw)),
+    }
+    if isinstance(grid.base, mmap.mmap):  # a paged world, counting every cell would load all of it back in
+        sizes["awake particles"] = sum(int(np.count_nonzero(grid[y0:y1 + 1, x0:x1 + 1]))
+                                       for x0, y0, x1, y1 in chunks.rects_in_use(chunk_rect))
+    else:
+        sizes["particles"] = int(np.count_nonzero(grid))
+    sizes["cell list size"] = len(cell_xs)
+    sizes["cell list high water"] = cell_list_high_water
+    sizes["cell list reuse %"] = round(100 * (1 - cell_list_grows / max(cell_list_uses, 1)), 1)
+    return sizes
+
+
+def begin_frame():
+    """Starts a new tick and wakes the chunks changed since the last frame, to call before the update_* functions."""
+    global tick
+    tick += 1
+    _wake_timers_kernel(world_arrays(), MATERIAL_TABLES, kept_cells, chunk_timer, tick)
+    return chunks.wake_chunks(chunk_changed, chunk_rect, chunk_awake, GRID_WIDTH, GRID_HEIGHT, CHUNK_SIZE)
+
+
+def initialize_grid(width: int = None, height: int = None, seed=RANDOM_SEED):
+    """Starts a new empty world, of width x height cells if given, else of the current size."""
+    global GRID_WIDTH, GRID_HEIGHT
+    global grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, grid_surface, screen_surface
+    global updated_tick, tick, chunk_changed, chunk_redraw, chunk_rect, chunk_awake, redraw_cells, changed_cells
+    global previous_grid, kept_cells, woken_cells, woken_tick, chunk_timer, drawn_view
+    if width is not None:
+        GRID_WIDTH = width
+    if height is not None:
+        GRID_HEIGHT = height
+    seed_random(seed)
+    grid = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    grid_color = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    grid_vx = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+    grid_vy = np.ones((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+    grid_tx = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+    grid_ty = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.float64)
+    grid_lifespan = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.int32)
+    updated_tick = np.full((GRID_HEIGHT, GRID_WIDTH), -1, dtype=np.int32)
+    tick = 0
+    chunk_changed = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)
+    chunk_redraw = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)
+    chunk_rect = chunks.new_rects(GRID_WIDTH, GRID_HEIGHT)
+    chunk_awake = np.zeros(chunk_rect.shape[:2], dtype=np.uint8)
+    redraw_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    changed_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    previous_grid = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    kept_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    woken_cells = np.zeros((GRID_HEIGHT, GRID_WIDTH), dtype=np.uint8)
+    woken_tick = -1
+    chunk_timer = np.full(chunk_awake.shape, NO_TIMER, dtype=np.int32)
+    grid_surface = pygame.Surface((GRID_WIDTH, GRID_HEIGHT), depth=8)  # one pixel per cell, holding its PALETTE index
+    screen_surface = pygame.Surface((1, 1), depth=8)  # the cells in view, scaled up, see draw_cells
+    drawn_view = None
+    _set_palette()
+    camera.set_world(GRID_WIDTH, GRID_HEIGHT)
+
+
+def clear_world():
+    """Empties the world. The new random stream is seeded from the current one, so replays clear the same way."""
+    initialize_grid(seed=random_int(0, 2 ** 53))
 
 
 def draw_grid(target_screen):
-    global grid_surface
-    for (x, y) in particles_to_clear:
-        pygame.draw.rect(grid_surface, EMPTY_COLOR,
-                         (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-
-    for p in particles_to_draw:
-        pygame.draw.rect(grid_surface, p.color, (p.x * CELL_SIZE,
-                         p.y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-    target_screen.blit(grid_surface, (0, 0))
-    particles_to_clear.clear()
-    particles_to_draw.clear()
-
-
-def update_near_particles(x: int, y: int):
-    ny = y - 1
-    if 0 <= ny < GRID_HEIGHT:
-        for dx in [-1, 0, 1]:  # normal falling blocks
-            nx = x + dx
-            if 0 <= nx < GRID_WIDTH:
-                p = grid[ny][nx]
-                if p is not None:
-                    if p.type in (SAND_ID, WATER_ID, ACID_ID):
-                        if p not in active_particles:
-                            active_particles.add(p)
-                            active_particles_copy.add(p)
-                        if p.type == ACID_ID:
-                            acid_particles.add(p)
-    for dx in [-1, 1]:  # water because it can spread sideways (also steam)
-        nx = x + dx
-        if 0 <= nx < GRID_WIDTH:
-            p = grid[y][nx]
-            if p is not None:
-                if p.type in (WATER_ID, ACID_ID):
-                    if p not in active_particles:
-                        active_particles.add(p)
-                        active_particles_copy.add(p)
-                    if p.type == ACID_ID:
-                        acid_particles.add(p)
-                elif p.type == STEAM_ID or p.type == SMOKE_ID:
-                    active_smoke_particles.add(p)
-    ny = y + 1
-    if 0 <= ny < GRID_HEIGHT:
-        for dx in [-1, 0, 1]:  # elements that go upwards like steam
-            nx = x + dx
-            if 0 <= nx < GRID_WIDTH:
-                p = grid[ny][nx]
-                if p is not None:
-                    if p.type == STEAM_ID or p.type == SMOKE_ID:
-                        active_smoke_particles.add(p)
+    """Writes the color indexes of the changed cells in view into grid_surface, then blits the view scaled by the camera."""
+    draw_cells(target_screen, chunk_redraw, grid, grid_color)
 
 
-@jit(nopython=True, cache=True, fastmath=True)
-def calculate_color_index(current_time: float, p_x: int, p_y: int, speed_factor: int, spatial_factor: int, palette_size: int):
-    return int(current_time * speed_factor + p_x * spatial_factor + p_y * spatial_factor) % palette_size
-
-def cycle_colors(CHROMATIC_PALETTE: list, palette_size: int):
-    current_time = time.time()
-    for p in chromatic_particles:
-        speed_factor = 50
-        spatial_factor = 2
-        
-        index = calculate_color_index(current_time, p.x, p.y, speed_factor, spatial_factor, palette_size)
-        
-        new_color = CHROMATIC_PALETTE[index]
-        if p.color != new_color:
-            p.color = new_color
-            particles_to_draw.add(p)
+def draw_cells(target_screen, redraw, cells, colors):
+    """draw_grid() from copies of the world, like the frames of simulation_thread. Clears redraw.
+
+    Changes out of view are dropped, the cells that come into view are drawn
+    again when the camera moves.
+    """
+    global screen_surface, drawn_view
+    view_x0, view_y0, view_x1, view_y1 = view = camera.visible_rect()
+    rects = chunks.rects_in_use(redraw)
+    if (view, camera.zoom) != drawn_view:
+        rects = [view]
+    rects = [(max(x0, view_x0), max(y0, view_y0), min(x1, view_x1), min(y1, view_y1)) for x0, y0, x1, y1 in rects
+             if x0 <= view_x1 and x1 >= view_x0 and y0 <= view_y1 and y1 >= view_y0]
+    if rects:
+        pixels = pygame.surfarray.pixels2d(grid_surface)  # indexed [x, y], locks the surface
+        for x0, y0, x1, y1 in rects:
+            types = cells[y0:y1 + 1, x0:x1 + 1]
+            color_index = np.where(types == EMPTY_ID, 0, colors[y0:y1 + 1, x0:x1 + 1])
+            chromatic = types == CHROMATIC_ID
+            if chromatic.any():  # the rainbow runs along the diagonals, cycle_colors moves it
+                diagonal = (np.arange(y0, y1 + 1)[:, None] + np.arange(x0, x1 + 1)) % COLOR_COUNTS[CHROMATIC_ID]
+                color_index[chromatic] = COLOR_OFFSETS[CHROMATIC_ID] + diagonal[chromatic]
+            pixels[x0:x1 + 1, y0:y1 + 1] = color_index.T
+        del pixels
+        width, height = view_x1 - view_x0 + 1, view_y1 - view_y0 + 1
+        size = (math.ceil(width * camera.zoom), math.ceil(height * camera.zoom))
+        if screen_surface.get_size() != size:
+            screen_surface = pygame.Surface(size, depth=8)
+            _set_palette()
+        pygame.transform.scale(grid_surface.subsurface((view_x0, view_y0, width, height)), size, screen_surface)
+        drawn_view = (view, camera.zoom)
+    chunks.clear_rects(redraw)
+    width, height = screen_surface.get_size()
+    if width < SCREEN_WIDTH:  # zoomed out further than the world, the rest of the view is empty
+        target_screen.fill(EMPTY_COLOR, (width, 0, SCREEN_WIDTH - width, WINDOW_HEIGHT))
+    if height < WINDOW_HEIGHT:
+        target_screen.fill(EMPTY_COLOR, (0, height, min(width, SCREEN_WIDTH), WINDOW_HEIGHT - height))
+    target_screen.blit(screen_surface, (0, 0), (0, 0, SCREEN_WIDTH, WINDOW_HEIGHT))
+
+
+def _set_palette():
+    """Gives both surfaces PALETTE with the chromatic colors rotated by chromatic_shift."""
+    offset = COLOR_OFFSETS[CHROMATIC_ID]
+    rainbow = PALETTE[offset:offset + COLOR_COUNTS[CHROMATIC_ID]]
+    palette = PALETTE[:offset] + rainbow[chromatic_shift:] + rainbow[:chromatic_shift] + PALETTE[offset + len(rainbow):]
+    grid_surface.set_palette(palette)
+    screen_surface.set_palette(palette)
+
+
+def cycle_colors(CHROMATIC_PALETTE: list, palette_size: int, current_time: float = None):
+    """Animates the chromatic cells by rotating their colors in the palette, no cell is touched."""
+    global chromatic_shift
+    if current_time is None:  # headless runs pass the frame time so they stay reproducible
+        current_time = time.time()
+    shift = int(current_time * CHROMATIC_SPEED) % palette_size
+    if shift != chromatic_shift:
+        chromatic_shift = shift
+        _set_palette()
 
 
 @jit(nopython=True, cache=True, fastmath=True)
-def apply_gravity(vx: float, vy: float, tx: float, ty: float, gravity: float):
+def apply_gravity(vx: float, vy: float, tx: float, ty: float, gravity: float, friction: float):
     V2 = vx**2 + vy**2
     if V2 > 0.0001:
         V = math.sqrt(V2)
-        damping = 1 - FRICTION * V
+        damping = 1 - friction * V
         vx *= damping
         vy = gravity + damping * vy
     else:
@@ -129,257 +407,55 @@ def apply_gravity(vx: float, vy: float, tx: float, ty: float, gravity: float):
     target_ty = ty + vy
     return target_tx, target_ty, round(target_tx), round(target_ty), vx, vy
 
-def update_acid_particles():
-    acid_particles_copy = acid_particles.copy()
-    for p in acid_particles_copy:
-        previous_x, previous_y = p.x, p.y
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = p.x + dx, p.y + dy
-            if 0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT:
-                target_cell = grid[ny][nx]
-                if target_cell != None and target_cell.type != ACID_ID:
-                    grid[previous_y][previous_x] = None
-                    grid[ny][nx] = None
-                    active_particles.discard(p)
-                    acid_particles.discard(p)
-                    particles_to_draw.discard(p)
-                    active_particles.discard(target_cell)
-                    fire_particles.discard(target_cell)
-                    burning_wood.discard(target_cell)
-                    active_smoke_particles.discard(target_cell)
-                    chromatic_particles.discard(target_cell)
-                    particles_to_draw.discard(target_cell)
-                    particles_to_clear.add((previous_x, previous_y))
-                    particles_to_clear.add((nx, ny))
-                    update_near_particles(nx, ny)
-                    update_near_particles(previous_x, previous_y)
-                    break
+def update_reactions():
+    """Runs the reactions of materials.REACTIONS between the neighbour cells of the awake chunks."""
+    seed = np.uint64(random_int(0, 2 ** 53))
+    return _react_kernel(world_arrays(), MATERIAL_TABLES, REACTION_TABLES, chunk_awake, chunk_rect, updated_tick, tick, seed)
 
 def update_fire_particles():
-    fire_particles_copy = fire_particles.copy()
-    for p in fire_particles_copy:
-        p.lifespan -= 1
-        previous_x, previous_y = p.x, p.y
-        if random.random() <= FIRE_DIES_PROBABILITY or p.lifespan == 0:
-            grid[previous_y][previous_x] = None
-            fire_particles.discard(p)
-            particles_to_draw.discard(p)
-            if random.random() <= SPAWN_SMOKE_PROBABILITY_FIRE: #spawns smoke
-                smoke = Particle(SMOKE_ID, previous_x, previous_y, random.choice(SMOKE_COLORS))
-                active_smoke_particles.add(smoke)
-                grid[previous_y][previous_x] = smoke
-                particles_to_draw.add(smoke)
-            else:
-                particles_to_clear.add((previous_x, previous_y))
-        else:
-            ny = previous_y - 1
-            if ny >= 0:
-                for dx in random.sample([-1, 0, 1], 3):
-                    nx = previous_x + dx
-                    if 0 <= nx < GRID_WIDTH:
-                        target_cell = grid[ny][nx]
-                        if target_cell == None:  # fire just moves
-                            p.x = nx
-                            p.y = ny
-                            p.tx, p.ty = p.x, p.y
-                            grid[ny][nx] = p
-                            grid[previous_y][previous_x] = None
-                            particles_to_clear.add((previous_x, previous_y))
-                            particles_to_draw.add(p)
-                            break
-                        # fire encounters water -> create steam
-                        elif target_cell.type == WATER_ID:
-                            water_particle = grid[ny][nx]
-                            grid[ny][nx] = None
-                            grid[previous_y][previous_x] = None
-                            active_particles.discard(water_particle)
-                            fire_particles.discard(p)
-                            particles_to_clear.add((previous_x, previous_y))
-                            particles_to_clear.add((nx, ny))
-                            steam1 = Particle(STEAM_ID, nx, ny, random.choice(STEAM_COLORS))
-                            steam2 = Particle(STEAM_ID, previous_x, previous_y, random.choice(STEAM_COLORS))
-                            grid[ny][nx] = steam1
-                            grid[previous_y][previous_x] = steam2
-                            active_smoke_particles.add(steam1)
-                            active_smoke_particles.add(steam2)
-                            particles_to_draw.add(steam1)
-                            particles_to_draw.add(steam2)
-                            particles_to_draw.discard(p)
-                            break
-                        # fire encounters wood, making burning wood
-                        elif target_cell.type == WOOD_ID:
-                            grid[ny][nx] = None
-                            grid[previous_y][previous_x] = None
-                            fire_particles.discard(p)
-                            particles_to_draw.discard(p)
-                            particles_to_clear.add((previous_x, previous_y))
-                            burning_wood_particle = Particle(BURNING_WOOD_ID, nx, ny, random.choice(BURNING_WOOD_COLORS))
-                            burning_wood_particle.lifespan = BURNING_WOOD_LIFESPAN
-                            grid[ny][nx] = burning_wood_particle
-                            particles_to_draw.add(burning_wood_particle)
-                            burning_wood.add(burning_wood_particle)
-                            break
+    """Fire rises, and dies out into smoke or nothing at random or at the end of its lifespan."""
+    xs, ys = cell_list(FIRE_ID)
+    seed = np.uint64(random_int(0, 2 ** 53))
+    return _fire_kernel(world_arrays(), MATERIAL_TABLES, PHYSICS, xs, ys, kept_cells, seed)
+
 
 def update_burning_wood():
-    burning_wood_copy = burning_wood.copy()
-    for p in burning_wood_copy:
-        previous_x, previous_y = p.x, p.y
-        burnt = False
-        p.lifespan -= 1
-
-        for dy in range(-1, 2):
-                ny = previous_y + dy
-                if 0 <= ny < GRID_HEIGHT:
-                    for dx in range(-1, 2):
-                        nx = previous_x + dx
-                        if 0 <= nx < GRID_WIDTH:
-                            checked_cell = grid[ny][nx]
-                            if checked_cell != None and checked_cell.type == WATER_ID:
-                                grid[ny][nx] = None
-                                grid[previous_y][previous_x] = None
-                                burning_wood.discard(p)
-                                active_particles.discard(checked_cell)
-                                steam_particle = Particle(STEAM_ID, nx, ny, random.choice(STEAM_COLORS))
-                                wood_particle = Particle(WOOD_ID, previous_x, previous_y, random.choice(WOOD_COLORS))
-                                grid[previous_y][previous_x] = wood_particle
-                                grid[ny][nx] = steam_particle
-                                active_smoke_particles.add(steam_particle)
-                                particles_to_draw.add(steam_particle)
-                                particles_to_draw.add(wood_particle)
-                                continue
-
-
-        if p.lifespan == 0:
-            grid[p.y][previous_x] = None
-            burning_wood.discard(p)
-            particles_to_clear.add((previous_x, previous_y))
-            r = random.random()
-            if r <= SPAWN_FIRE_PROBABILITY: #spawns fire particle
-                fire_particle = Particle(FIRE_ID, previous_x, previous_y, random.choice(FIRE_COLORS))
-                p.lifespan = FIRE_LIFESPAN + random.randint(-FIRE_LIFESPAN_VARIATION, FIRE_LIFESPAN_VARIATION)
-                grid[previous_y][previous_x] = fire_particle
-                fire_particles.add(fire_particle)
-            elif r <= SPAWN_SMOKE_PROBABILITY_WOOD:
-                smoke = Particle(SMOKE_ID, previous_x, previous_y, random.choice(SMOKE_COLORS))
-                active_smoke_particles.add(smoke)
-                grid[previous_y][previous_x] = smoke
-                particles_to_draw.add(smoke)
-            burnt = True
-        
-        if random.random() <= BURNING_SPREAD_PROBABILITY or burnt: #burn other wood particle around
-            update_near_particles(previous_x, previous_y)
-            for dy in range(-1, 2):
-                ny = previous_y + dy
-                if 0 <= ny < GRID_HEIGHT:
-                    for dx in range(-1, 2):
-                        nx = previous_x + dx
-                        if 0 <= nx < GRID_WIDTH:
-                            checked_cell = grid[ny][nx]
-                            if checked_cell != None and checked_cell.type == WOOD_ID:
-                                grid[ny][nx] = None
-                                burning_wood_particle = Particle(BURNING_WOOD_ID, nx, ny, random.choice(BURNING_WOOD_COLORS))
-                                burning_wood_particle.lifespan = BURNING_WOOD_LIFESPAN
-                                grid[ny][nx] = burning_wood_particle
-                                particles_to_draw.add(burning_wood_particle)
-                                burning_wood.add(burning_wood_particle)
+    """Burning wood burns out into fire, smoke or nothing, and sets the wood around it on fire."""
+    xs, ys = cell_list(BURNING_WOOD_ID)
+    seed = np.uint64(random_int(0, 2 ** 53))
+    return _burning_wood_kernel(world_arrays(), MATERIAL_TABLES, PHYSICS, xs, ys, kept_cells, seed)
 
 def update_smoke_particles():
-    active_smoke_particles_copy = active_smoke_particles.copy()
-    for p in active_smoke_particles_copy:
-        previous_x, previous_y = p.x, p.y
-        moved = False
-        top = False
-        ny = previous_y - 1
-        if ny >= 0:
-            cell_above = grid[ny][previous_x]
-            for dx in random.sample([-1, 0, 1], 3):
-                nx = previous_x + dx
-                if 0 <= nx < GRID_WIDTH:
-                    cell_adjacent = grid[previous_y][nx]
-                    target_cell = grid[ny][nx]
-                    if target_cell == None:
-                        if cell_above == None or cell_adjacent == None or (cell_above.type not in [CHROMATIC_ID, STONE_ID, WOOD_ID] and cell_adjacent.type not in [CHROMATIC_ID, STONE_ID, WOOD_ID]):
-                            p.x = nx
-                            p.y = ny
-                            p.tx, p.ty = p.x, p.y
-                            moved = True
-                            break
-                    elif target_cell.type == FIRE_ID:
-                        if cell_above == None or cell_adjacent == None or (cell_above.type not in [CHROMATIC_ID, STONE_ID, WOOD_ID] and cell_adjacent.type not in [CHROMATIC_ID, STONE_ID, WOOD_ID]):
-                            p.x = nx
-                            p.y = ny
-                            p.tx, p.ty = p.x, p.y
-                            moved = True
-                            grid[ny][nx] = None
-                            fire_particles.discard(target_cell)
-                            break
-
-        if not moved:
-            top = True
-            if ny >= 0:
-                for dx in range(-1, 0, 1):
-                    nx = previous_x + dx
-                    if grid[ny][nx] == None or grid[ny][nx].type not in [STONE_ID, CHROMATIC_ID, WOOD_ID]:
-                        top = False
-                        break
-        
-        
-        if top:
-            r = random.random()
-            if p.type == STEAM_ID:
-                if r <= CONDENSE_PROBABILITY:  # steam condenses into water
-                    
-                    grid[previous_y][previous_x] = None
-                    water_particle = Particle(
-                        WATER_ID, previous_x, previous_y, random.choice(WATER_COLORS))
-                    grid[previous_y][previous_x] = water_particle
-                    particles_to_draw.add(water_particle)
-                    active_particles.add(water_particle)
-                    active_smoke_particles.discard(p)
-                    continue
-                elif r <= STEAM_TO_WATER_RATIO * CONDENSE_PROBABILITY:  # the steam dissapear
-                    grid[previous_y][previous_x] = None
-                    particles_to_clear.add((previous_x, previous_y))
-                    active_smoke_particles.discard(p)
-                    update_near_particles(previous_x, previous_y)
-                    continue
-            elif p.type == SMOKE_ID:
-                if r <= SMOKE_DISSIPATE_PROBABILITY:
-                    grid[previous_y][previous_x] = None
-                    active_smoke_particles.discard(p)
-                    particles_to_clear.add((previous_x, previous_y))
-                    update_near_particles(previous_x, previous_y)
-                    continue
-            
-        if not moved:
-            for dx in random.sample([-1, 1], 2):
-                nx = previous_x + dx
-                if 0 <= nx < GRID_WIDTH:
-                    if grid[previous_y][nx] == None:
-                        p.x = nx
-                        p.tx = p.x
-                        moved = True
-                        break
-        if moved:
-            particles_to_clear.add((previous_x, previous_y))
-            grid[previous_y][previous_x] = None
-            particles_to_draw.add(p)
-            grid[p.y][p.x] = p
-            active_smoke_particles.add(p)
-            update_near_particles(previous_x, previous_y)
-        elif not top:
-            active_smoke_particles.discard(p)
-
-
-def _find_furthest_spread_x(original_x, current_y, dx_direction, grid, GRID_WIDTH, MAX_SPREAD_DIST):
+    """Steam and smoke rise, spread along ceilings and condense or dissipate under them."""
+    wake_cells()
+    seed = np.uint64(random_int(0, 2 ** 53))
+    return _gas_kernel(world_arrays(), MATERIAL_TABLES, PHYSICS, chunk_awake, chunk_rect, woken_cells, kept_cells, chunk_timer, tick, seed)
+
+
+@jit(nopython=True, cache=True)
+def _cell_random(seed, x, y, draw):
+    """Number in [0, 1) for the given draw of the cell (x, y) this frame.
+
+    It only depends on the frame seed and the position (splitmix64 of them), so it
+    doesn't matter in which order or on which thread the cells are updated.
+    """
+    z = seed + np.uint64(x) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(y) * np.uint64(0xC2B2AE3D27D4EB4F) + np.uint64(draw)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+@jit(nopython=True, cache=True)
+def _find_furthest_spread_x(original_x, current_y, dx_direction, grid, GRID_WIDTH, max_spread_dist):
     furthest_x = original_x
-    for dist in range(1, MAX_SPREAD_DIST + 1):
+    for dist in range(1, max_spread_dist + 1):
         check_x = original_x + (dx_direction * dist)
 
         if check_x < 0 or check_x >= GRID_WIDTH:
             break
 
-        if grid[current_y][check_x] is None:
+        if grid[current_y, check_x] == EMPTY_ID:
             furthest_x = check_x
         else:
             break  # Blocked
@@ -387,176 +463,591 @@ def _find_furthest_spread_x(original_x, current_y, dx_direction, grid, GRID_WIDT
     return furthest_x
 
 
-def update_particles():
-    global grid, active_particles, active_particles_copy, particles_to_clear, particles_to_draw
-    active_particles_copy = active_particles.copy()
-    while active_particles_copy:
-        buckets = [[] for _ in range(GRID_HEIGHT)]
-        for p in active_particles_copy:
-            buckets[p.y].append(p)
-        active_particles_copy = set()
-        for y in range(GRID_HEIGHT - 1, -1, -1):
-            for p in buckets[y]:
-                previous_x, previous_y = p.x, p.y
-
-                target_tx, target_ty, int_target_x, int_target_y, p.vx, p.vy = apply_gravity(
-                    float(p.vx), float(p.vy), float(p.tx), float(p.ty), GRAVITY)
-
-                moved = False
-                if abs(int_target_x - previous_x) <= 1 and abs(int_target_y - previous_y) <= 1:
-                    path = [(previous_x, previous_y),
-                            (int_target_x, int_target_y)]
-                else:
-                    path = get_line(previous_x, previous_y,
-                                    int_target_x, int_target_y)
-
-                last_empty = (previous_x, previous_y)
-                final_x, final_y = previous_x, previous_y
-                collision = False
-
-                for nx, ny in path[1:]:
-                    if not (0 <= nx < GRID_WIDTH and 0 <= ny < GRID_HEIGHT):
-                        collision = True
-                        break
-                    cell_content = grid[ny][nx]
+@jit(nopython=True, cache=True)
+def _move_cell(world, x0, y0, x1, y1):
+    grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, chunk_redraw, chunk_changed, chunk_size = world
+    grid[y1, x1] = grid[y0, x0]
+    grid_color[y1, x1] = grid_color[y0, x0]
+    grid_vx[y1, x1] = grid_vx[y0, x0]
+    grid_vy[y1, x1] = grid_vy[y0, x0]
+    grid_tx[y1, x1] = grid_tx[y0, x0]
+    grid_ty[y1, x1] = grid_ty[y0, x0]
+    grid_lifespan[y1, x1] = grid_lifespan[y0, x0]
+    grid[y0, x0] = EMPTY_ID
+    chunks.mark_changed(chunk_redraw, chunk_changed, x0, y0, chunk_size)
+    chunks.mark_changed(chunk_redraw, chunk_changed, x1, y1, chunk_size)
 
-                    if cell_content is None:
-                        final_x, final_y = nx, ny
-                        last_empty = (nx, ny)
-                        continue
-                    elif cell_content.type == FIRE_ID:
-                        final_x, final_y = nx, ny
-                        last_empty = (nx, ny)
-                        fire_particles.discard(cell_content)
-                        grid[ny][nx] = None
-                        particles_to_clear.add((nx, ny))
-                        continue
 
-                    # swap between two particles
-                    elif (cell_content.type == WATER_ID and p.type == SAND_ID) or cell_content.type == STEAM_ID or cell_content.type == SMOKE_ID:
-                        final_x, final_y = nx, ny
-                        break
+@jit(nopython=True, cache=True)
+def _swap_cells(world, x0, y0, x1, y1):
+    grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, chunk_redraw, chunk_changed, chunk_size = world
+    grid[y0, x0], grid[y1, x1] = grid[y1, x1], grid[y0, x0]
+    grid_color[y0, x0], grid_color[y1, x1] = grid_color[y1, x1], grid_color[y0, x0]
+    grid_vx[y0, x0], grid_vx[y1, x1] = grid_vx[y1, x1], grid_vx[y0, x0]
+    grid_vy[y0, x0], grid_vy[y1, x1] = grid_vy[y1, x1], grid_vy[y0, x0]
+    grid_tx[y0, x0], grid_tx[y1, x1] = grid_tx[y1, x1], grid_tx[y0, x0]
+    grid_ty[y0, x0], grid_ty[y1, x1] = grid_ty[y1, x1], grid_ty[y0, x0]
+    grid_lifespan[y0, x0], grid_lifespan[y1, x1] = grid_lifespan[y1, x1], grid_lifespan[y0, x0]
+    chunks.mark_changed(chunk_redraw, chunk_changed, x0, y0, chunk_size)
+    chunks.mark_changed(chunk_redraw, chunk_changed, x1, y1, chunk_size)
 
-                    else:
-                        collision = True
-                        break
 
-                if (previous_x, previous_y) != (final_x, final_y):
-                    grid[previous_y][previous_x] = None
-                    p.x, p.y = final_x, final_y
-                    grid[final_y][final_x] = None
-
-                    if cell_content is not None and ((p.type == SAND_ID and cell_content.type == WATER_ID) or cell_content.type == STEAM_ID or cell_content.type == SMOKE_ID):
-                        cell_content.x = last_empty[0]
-                        cell_content.y = last_empty[1]
-                        cell_content.tx = cell_content.x
-                        cell_content.ty = cell_content.y
-                        grid[cell_content.y][cell_content.x] = cell_content
-                        if cell_content.type == WATER_ID and cell_content not in active_particles:
-                            active_particles_copy.add(cell_content)
-                            active_particles.add(cell_content)
-                        elif cell_content.type == STEAM_ID or cell_content.type == SMOKE_ID:
-                            active_smoke_particles.add(cell_content)
-                        particles_to_draw.add(cell_content)
-                        p.vx *= 0.6
-                        p.vy *= 0.6
-
-                    if collision:
-                        p.tx, p.ty = p.x, p.y
-                        p.vx *= 0.5
-                        p.vy *= 0.5
+@jit(nopython=True, cache=True)
+def _can_swap(materials, p_type, cell_type):
+    """A falling particle sinks into a liquid or a gas lighter than itself."""
+    material_flags, density = materials[0], materials[1]
+    return (material_flags[cell_type] & (LIQUID | GAS)) != 0 and density[p_type] > density[cell_type]
+
+
+@jit(nopython=True, cache=True)
+def _set_cell(world, materials, seed, x, y, type):
+    """create_particle for the kernels, the color and lifespan come from _cell_random."""
+    grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, chunk_redraw, chunk_changed, chunk_size = world
+    material_flags, density, color_offsets, color_counts, lifespans, lifespan_variations = materials
+    if grid[y, x] == type:
+        return
+    grid[y, x] = type
+    if type != EMPTY_ID:
+        grid_color[y, x] = color_offsets[type] + int(_cell_random(seed, x, y, 5) * color_counts[type])
+        grid_vx[y, x] = 0.0
+        grid_vy[y, x] = 1.0
+        grid_tx[y, x] = x
+        grid_ty[y, x] = y
+        variation = lifespan_variations[type]
+        grid_lifespan[y, x] = lifespans[type] + int(_cell_random(seed, x, y, 6) * (2 * variation + 1)) - variation
+    chunks.mark_changed(chunk_redraw, chunk_changed, x, y, chunk_size)
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _wake_cells_kernel(grid, previous_grid, kept_cells, woken_cells, chunk_awake, chunk_rect):
+    """Sets woken_cells inside the awake rects: the 3x3 dilation of the cells changed or kept since the last call.
+
+    A cell only changed since the last call if it is in a rect, and the rects are
+    grown by one cell, so the dilation never needs a cell outside of them.
+    """
+    height, width = grid.shape
+    chunks_y, chunks_x = chunk_awake.shape
+    for cy in range(chunks_y):  # kept_cells becomes the changed or kept cells
+        for cx in range(chunks_x):
+            if chunk_awake[cy, cx]:
+                x0, y0, x1, y1 = chunk_rect[cy, cx]
+                for y in range(y0, y1 + 1):
+                    for x in range(x0, x1 + 1):
+                        if grid[y, x] != previous_grid[y, x]:
+                            kept_cells[y, x] = 1
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if chunk_awake[cy, cx]:
+                x0, y0, x1, y1 = chunk_rect[cy, cx]
+                for y in range(y0, y1 + 1):
+                    for x in range(x0, x1 + 1):
+                        woken_cells[y, x] = kept_cells[max(y - 1, 0):y + 2, max(x - 1, 0):x + 2].any()
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if chunk_awake[cy, cx]:
+                x0, y0, x1, y1 = chunk_rect[cy, cx]
+                previous_grid[y0:y1 + 1, x0:x1 + 1] = grid[y0:y1 + 1, x0:x1 + 1]
+                kept_cells[y0:y1 + 1, x0:x1 + 1] = 0
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _woken_cells_of(grid, woken_cells, chunk_awake, chunk_rect, type, xs, ys):
+    """Fills xs, ys with the woken cells of type in the awake rects and returns their number.
+
+    Past the length of xs the cells are only counted, the caller grows the arrays and calls again.
+    """
+    count = 0
+    chunks_y, chunks_x = chunk_awake.shape
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if not chunk_awake[cy, cx]:
+                continue
+            x0, y0, x1, y1 = chunk_rect[cy, cx]
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    if grid[y, x] == type and woken_cells[y, x]:
+                        if count < len(xs):
+                            xs[count] = x
+                            ys[count] = y
+                        count += 1
+    return count
+
+
+@jit(nopython=True, cache=True)
+def _keep_cell_awake(world, kept_cells, x, y):
+    kept_cells[y, x] = 1
+    chunks.keep_awake(world[8], x, y, world[9])
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _fire_kernel(world, materials, physics, xs, ys, kept_cells, seed):
+    """update_fire_particles over the fire that was in the woken cells when it started. Returns the number of fire cells."""
+    grid, grid_tx, grid_ty, grid_lifespan = world[0], world[4], world[5], world[6]
+    width = grid.shape[1]
+    for i in range(len(xs)):
+        x, y = xs[i], ys[i]
+        if grid[y, x] != FIRE_ID:  # the fire was put out by something else
+            continue
+        grid_lifespan[y, x] -= 1
+        _keep_cell_awake(world, kept_cells, x, y)
+        if _cell_random(seed, x, y, 0) <= physics.fire_dies_probability or grid_lifespan[y, x] == 0:
+            _set_cell(world, materials, seed, x, y, SMOKE_ID if _cell_random(seed, x, y, 1) <= physics.spawn_smoke_probability_fire else EMPTY_ID)
+        elif y > 0:
+            for dx in PERMUTATIONS_3[int(_cell_random(seed, x, y, 2) * 6)]:
+                nx = x + dx
+                if 0 <= nx < width and grid[y - 1, nx] == EMPTY_ID:  # water and wood are reactions
+                    _move_cell(world, x, y, nx, y - 1)
+                    grid_tx[y - 1, nx], grid_ty[y - 1, nx] = nx, y - 1
+                    break
+    return len(xs)
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _burning_wood_kernel(world, materials, physics, xs, ys, kept_cells, seed):
+    """update_burning_wood over the burning wood that was in the woken cells when it started. Returns its number of cells."""
+    grid, grid_lifespan = world[0], world[6]
+    material_flags = materials[0]
+    height, width = grid.shape
+    for i in range(len(xs)):
+        x, y = xs[i], ys[i]
+        if grid[y, x] != BURNING_WOOD_ID:  # put out by water
+            continue
+        grid_lifespan[y, x] -= 1
+        _keep_cell_awake(world, kept_cells, x, y)
+        if grid_lifespan[y, x] != 0:
+            continue
+        r = _cell_random(seed, x, y, 0)
+        if r <= physics.spawn_fire_probability:
+            _set_cell(world, materials, seed, x, y, FIRE_ID)
+        elif r <= physics.spawn_smoke_probability_wood:
+            _set_cell(world, materials, seed, x, y, SMOKE_ID)
+        else:
+            _set_cell(world, materials, seed, x, y, EMPTY_ID)
+        # burnt wood sets all the wood around on fire, the slow spread is a reaction
+        for ny in range(max(y - 1, 0), min(y + 2, height)):
+            for nx in range(max(x - 1, 0), min(x + 2, width)):
+                if material_flags[grid[ny, nx]] & FLAMMABLE:
+                    _set_cell(world, materials, seed, nx, ny, BURNING_WOOD_ID)
+    return len(xs)
+
+
+@jit(nopython=True, cache=True)
+def _fate_probability(physics, type):
+    """Chance a gas under a ceiling condenses or dissipates each tick."""
+    if type == STEAM_ID:
+        return physics.steam_to_water_ratio * physics.condense_probability
+    if type == SMOKE_ID:
+        return physics.smoke_dissipate_probability
+    return 0.0
+
+
+@jit(nopython=True, cache=True)
+def _wake_around(woken_cells, x, y):
+    """Wakes the 3x3 cells around (x, y) not visited yet by the running kernel (woken_cells 2)."""
+    height, width = woken_cells.shape
+    for ny in range(max(y - 1, 0), min(y + 2, height)):
+        for nx in range(max(x - 1, 0), min(x + 2, width)):
+            if woken_cells[ny, nx] == 0:
+                woken_cells[ny, nx] = 1
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _gas_kernel(world, materials, physics, chunk_awake, chunk_rect, woken_cells, kept_cells, chunk_timer, tick, seed):
+    """update_smoke_particles over the gas in the woken cells. Returns the number of gas cells visited.
+
+    A gas that moves or goes wakes the cells around it, so a column of gas rises
+    in one tick like it did when every gas cell was visited. A gas under a ceiling
+    draws once, in grid_lifespan, the tick it condenses or dissipates at (the same
+    odds as a draw every tick) and sleeps until then, see _wake_timers_kernel.
+    """
+    grid, grid_tx, grid_ty, grid_lifespan, chunk_size = world[0], world[4], world[5], world[6], world[9]
+    material_flags = materials[0]
+    width = grid.shape[1]
+    chunks_y, chunks_x = chunk_awake.shape
+    visited = 0
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if not chunk_awake[cy, cx]:
+                continue
+            x0, y0, x1, y1 = chunk_rect[cy, cx]
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    p_type = grid[y, x]
+                    if woken_cells[y, x] != 1 or not material_flags[p_type] & GAS:
+                        continue
+                    visited += 1
+                    new_x, new_y = x, y
+                    moved = False
+                    if y > 0:
+                        above_type = grid[y - 1, x]
+                        for dx in PERMUTATIONS_3[int(_cell_random(seed, x, y, 0) * 6)]:
+                            nx = x + dx
+                            if 0 <= nx < width:
+                                adjacent_type = grid[y, nx]
+                                target_type = grid[y - 1, nx]
+                                if target_type == EMPTY_ID or target_type == FIRE_ID:  # gas puts the fire out
+                                    if (above_type == EMPTY_ID or adjacent_type == EMPTY_ID
+                                            or not (material_flags[above_type] | material_flags[adjacent_type]) & SOLID):
+                                        new_x, new_y = nx, y - 1
+                                        moved = True
+                                        break
+                    top = not moved and (y == 0 or material_flags[grid[y - 1, x]] & SOLID != 0)  # under a ceiling
+                    if not top:
+                        grid_lifespan[y, x] = 0
                     else:
-                        p.tx = target_tx
-                        p.ty = target_ty
-                    moved = True
-
-                if not moved:
-                    # diagonals
-                    for dx in random.sample([-1, 1], 2):
-                        nx = p.x + dx
-                        ny = p.y + 1
-                        if 0 <= nx < GRID_WIDTH and ny < GRID_HEIGHT:
-                            cell_content = grid[ny][nx]
-                            cell_adjacent = grid[p.y][nx]
-                            cell_under = grid[ny][p.x]
-                            if (cell_adjacent != None and cell_under != None):
-                                if cell_adjacent.type in [STONE_ID, CHROMATIC_ID, WOOD_ID] and cell_under.type in [STONE_ID, CHROMATIC_ID, WOOD_ID]:
-                                    continue
-                            if cell_content is None:
-                                grid[previous_y][previous_x] = None
-                                p.x, p.y = nx, ny
-                                p.tx, p.ty = p.x, p.y
+                        if grid_lifespan[y, x] == 0:
+                            probability = _fate_probability(physics, p_type)
+                            if probability > 0.0:
+                                ticks = 1
+                                if probability < 1.0:
+                                    ticks += int(np.log(1.0 - _cell_random(seed, x, y, 1)) / np.log(1.0 - probability))
+                                grid_lifespan[y, x] = min(tick + ticks - 1, NO_TIMER - 1)
+                        if grid_lifespan[y, x] != 0 and grid_lifespan[y, x] <= tick:
+                            if p_type == STEAM_ID and _cell_random(seed, x, y, 3) * _fate_probability(physics, p_type) <= physics.condense_probability:
+                                _set_cell(world, materials, seed, x, y, WATER_ID)
+                            else:
+                                _set_cell(world, materials, seed, x, y, EMPTY_ID)
+                            _wake_around(woken_cells, x, y)
+                            continue
+                    if not moved:
+                        first = -1 if _cell_random(seed, x, y, 2) < 0.5 else 1
+                        for dx in (first, -first):
+                            nx = x + dx
+                            if 0 <= nx < width and grid[y, nx] == EMPTY_ID:
+                                new_x = nx
                                 moved = True
                                 break
-                            elif cell_content.type == FIRE_ID:
-                                grid[previous_y][previous_x] = None
-                                grid[ny][nx] = None
-                                p.x, p.y = nx, ny
-                                p.tx, p.ty = nx, ny
-                                moved = True
-                                fire_particles.discard(cell_content)
-                                break
+                    if moved:
+                        _move_cell(world, x, y, new_x, new_y)
+                        grid_tx[new_y, new_x], grid_ty[new_y, new_x] = new_x, new_y
+                        _wake_around(woken_cells, x, y)
+                        woken_cells[new_y, new_x] = 2
+                    elif top and grid_lifespan[y, x] != 0:  # stuck under the ceiling, sleeps until its tick
+                        chunk_timer[y // chunk_size, x // chunk_size] = min(chunk_timer[y // chunk_size, x // chunk_size],
+                                                                             grid_lifespan[y, x])
+    return visited
 
-                            elif (p.type == SAND_ID and cell_content.type == WATER_ID) or cell_content.type == STEAM_ID or cell_content.type == SMOKE_ID:
-                                grid[previous_y][previous_x] = None
-                                grid[ny][nx] = None
-                                grid[previous_y][previous_x] = cell_content
-                                cell_content.x, cell_content.tx = previous_x, previous_x
-                                cell_content.y, cell_content.ty = previous_y, previous_y
-                                p.x, p.y = nx, ny
-
-                                p.tx, p.ty = nx, ny
-                                # p.vx *= 0.6
-                                # p.vy *= 0.6
-
-                                if cell_content not in active_particles and (cell_content.type != STEAM_ID and cell_content.type != SMOKE_ID):
-                                    active_particles_copy.add(cell_content)
-                                    active_particles.add(cell_content)
-                                particles_to_draw.add(cell_content)
-                                moved = True
-                                break
 
-                if not moved and (p.type == WATER_ID or p.type == ACID_ID):
-
-                    direction1 = 1
-                    direction2 = -1
-                    if random.choice([True, False]):
-                        direction1 = -1
-                        direction2 = 1
-
-                    final_new_x = previous_x
-
-                    calculated_new_x = _find_furthest_spread_x(
-                        previous_x, previous_y, direction1, grid, GRID_WIDTH, MAX_SPREAD_DIST)
-                    if calculated_new_x != previous_x:
-                        final_new_x = calculated_new_x
-                        grid[previous_y][previous_x] = None
-                        p.x = final_new_x
-                        p.y = previous_y
-                        p.tx = p.x
-                        p.ty = p.y
-                        moved = True
-                    else:
-                        calculated_new_x = _find_furthest_spread_x(
-                            previous_x, previous_y, direction2, grid, GRID_WIDTH, MAX_SPREAD_DIST)
-                        if calculated_new_x != previous_x:
-                            final_new_x = calculated_new_x
-                            grid[previous_y][previous_x] = None
-                            p.x = final_new_x
-                            p.y = previous_y
-                            p.tx = p.x
-                            p.ty = p.y
-                            moved = True                     
-
-                        
-                # Update grid
-                grid[p.y][p.x] = p
-
-                if moved:
-                    update_near_particles(previous_x, previous_y)
-                    particles_to_clear.add((previous_x, previous_y))
-                    particles_to_draw.add(p)
-                else:
-                    active_particles.discard(p)
-                    p.vx = 0
-                    p.vy = 1
+@jit(nopython=True, nogil=True, cache=True)
+def _wake_timers_kernel(world, materials, kept_cells, chunk_timer, tick):
+    """Wakes the sleeping gas of the chunks whose timer is due, the timer moves on to the next one."""
+    grid, grid_lifespan, chunk_size = world[0], world[6], world[9]
+    material_flags = materials[0]
+    height, width = grid.shape
+    chunks_y, chunks_x = chunk_timer.shape
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if chunk_timer[cy, cx] > tick:
+                continue
+            next_tick = NO_TIMER
+            for y in range(cy * chunk_size, min((cy + 1) * chunk_size, height)):
+                for x in range(cx * chunk_size, min((cx + 1) * chunk_size, width)):
+                    if material_flags[grid[y, x]] & GAS and grid_lifespan[y, x] != 0:
+                        if grid_lifespan[y, x] <= tick:
+                            _keep_cell_awake(world, kept_cells, x, y)
+                        else:
+                            next_tick = min(next_tick, grid_lifespan[y, x])
+            chunk_timer[cy, cx] = next_tick
+
+
+NEIGHBOURS_X = (0, 1, 0, -1)
+NEIGHBOURS_Y = (-1, 0, 1, 0)
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _react_kernel(world, materials, reactions, chunk_awake, chunk_rect, updated_tick, tick, seed):
+    """Lets every cell of the awake chunks react with one of its four neighbours.
+
+    The neighbours are tried from a random one and the first reaction that happens
+    wins. Cells made by a reaction don't react again this tick. Returns the number
+    of reactions.
+    """
+    grid = world[0]
+    probability, results, reactive = reactions
+    height, width = grid.shape
+    chunks_y, chunks_x = chunk_awake.shape
+    reacted = 0
+    for cy in range(chunks_y):
+        for cx in range(chunks_x):
+            if not chunk_awake[cy, cx]:
+                continue
+            x0, y0, x1, y1 = chunk_rect[cy, cx]
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    a = grid[y, x]
+                    if not reactive[a] or updated_tick[y, x] == tick:
+                        continue
+                    first = int(_cell_random(seed, x, y, 0) * 4)
+                    for i in range(4):
+                        nx = x + NEIGHBOURS_X[(first + i) % 4]
+                        ny = y + NEIGHBOURS_Y[(first + i) % 4]
+                        if not (0 <= nx < width and 0 <= ny < height) or updated_tick[ny, nx] == tick:
+                            continue
+                        b = grid[ny, nx]
+                        chance = probability[a, b]
+                        if chance == 0.0 or (chance < 1.0 and _cell_random(seed, x, y, 1 + i) >= chance):
+                            continue
+                        _set_cell(world, materials, seed, x, y, results[a, b, 0])
+                        _set_cell(world, materials, seed, nx, ny, results[a, b, 1])
+                        updated_tick[y, x] = tick
+                        updated_tick[ny, nx] = tick
+                        reacted += 1
+                        break
+    return reacted
+
+
+@jit(nopython=True, cache=True)
+def _update_particle(world, materials, physics, updated_tick, tick, seed, previous_x, previous_y):
+    """Moves the falling (powder or liquid) particle at (previous_x, previous_y), returns True if it moved."""
+    grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, chunk_redraw, chunk_changed, chunk_size = world
+    material_flags = materials[0]
+    height, width = grid.shape
+    p_type = grid[previous_y, previous_x]
+
+    target_tx, target_ty, int_target_x, int_target_y, vx, vy = apply_gravity(
+        grid_vx[previous_y, previous_x], grid_vy[previous_y, previous_x],
+        grid_tx[previous_y, previous_x], grid_ty[previous_y, previous_x], physics.gravity, physics.friction)
+    grid_vx[previous_y, previous_x] = vx
+    grid_vy[previous_y, previous_x] = vy
+    max_step = physics.max_step
+    if abs(int_target_x - previous_x) > max_step or abs(int_target_y - previous_y) > max_step:
+        # keeps every move inside the neighbour chunks, the parallel update relies on it
+        int_target_x = min(max(int_target_x, previous_x - max_step), previous_x + max_step)
+        int_target_y = min(max(int_target_y, previous_y - max_step), previous_y + max_step)
+        target_tx, target_ty = float(int_target_x), float(int_target_y)
+
+    # walk the line towards the target (same steps as utils.get_line)
+    last_empty_x, last_empty_y = previous_x, previous_y
+    final_x, final_y = previous_x, previous_y
+    collision = False
+    cell_type = EMPTY_ID
+    line_x, line_y = previous_x, previous_y
+    line_dx = abs(int_target_x - previous_x)
+    line_dy = -abs(int_target_y - previous_y)
+    step_x = 1 if previous_x < int_target_x else -1
+    step_y = 1 if previous_y < int_target_y else -1
+    err = line_dx + line_dy
+    while line_x != int_target_x or line_y != int_target_y:
+        e2 = 2 * err
+        if e2 >= line_dy:
+            err += line_dy
+            line_x += step_x
+        if e2 <= line_dx:
+            err += line_dx
+            line_y += step_y
+
+        if not (0 <= line_x < width and 0 <= line_y < height):
+            collision = True
+            break
+        cell_type = grid[line_y, line_x]
+
+        if cell_type == EMPTY_ID:
+            final_x, final_y = line_x, line_y
+            last_empty_x, last_empty_y = line_x, line_y
+        elif cell_type == FIRE_ID:
+            final_x, final_y = line_x, line_y
+            last_empty_x, last_empty_y = line_x, line_y
+            grid[line_y, line_x] = EMPTY_ID
+            chunks.mark_changed(chunk_redraw, chunk_changed, line_x, line_y, chunk_size)
+            cell_type = EMPTY_ID
+        # swap between two particles
+        elif _can_swap(materials, p_type, cell_type):
+            final_x, final_y = line_x, line_y
+            break
+        else:
+            collision = True
+            break
+
+    x, y = previous_x, previous_y
+    if final_x != previous_x or final_y != previous_y:
+        if _can_swap(materials, p_type, cell_type):
+            # the displaced particle goes to the last empty cell of the path
+            if last_empty_x != previous_x or last_empty_y != previous_y:
+                _move_cell(world, final_x, final_y, last_empty_x, last_empty_y)
+                _move_cell(world, previous_x, previous_y, final_x, final_y)
+            else:
+                _swap_cells(world, previous_x, previous_y, final_x, final_y)
+            grid_tx[last_empty_y, last_empty_x] = last_empty_x
+            grid_ty[last_empty_y, last_empty_x] = last_empty_y
+            updated_tick[last_empty_y, last_empty_x] = tick
+            grid_vx[final_y, final_x] *= 0.6
+            grid_vy[final_y, final_x] *= 0.6
+        else:
+            _move_cell(world, previous_x, previous_y, final_x, final_y)
+        x, y = final_x, final_y
+
+        if collision:
+            grid_tx[y, x], grid_ty[y, x] = x, y
+            grid_vx[y, x] *= 0.5
+            grid_vy[y, x] *= 0.5
+        else:
+            grid_tx[y, x] = target_tx
+            grid_ty[y, x] = target_ty
+    else:
+        # diagonals
+        first_dx = 1 if _cell_random(seed, previous_x, previous_y, 0) < 0.5 else -1
+        for dx in (first_dx, -first_dx):
+            nx = x + dx
+            ny = y + 1
+            if 0 <= nx < width and ny < height:
+                cell_type = grid[ny, nx]
+                adjacent_type = grid[y, nx]
+                under_type = grid[ny, x]
+                if material_flags[adjacent_type] & SOLID and material_flags[under_type] & SOLID:
+                    continue
+                if cell_type == EMPTY_ID or cell_type == FIRE_ID:
+                    _move_cell(world, x, y, nx, ny)
+                    x, y = nx, ny
+                    grid_tx[y, x], grid_ty[y, x] = x, y
+                    break
+                elif _can_swap(materials, p_type, cell_type):
+                    _swap_cells(world, x, y, nx, ny)
+                    grid_tx[previous_y, previous_x], grid_ty[previous_y, previous_x] = previous_x, previous_y
+                    x, y = nx, ny
+                    grid_tx[y, x], grid_ty[y, x] = x, y
+                    break
+
+        if x == previous_x and y == previous_y and material_flags[p_type] & LIQUID:
+            direction = 1 if _cell_random(seed, previous_x, previous_y, 1) < 0.5 else -1
+            new_x = _find_furthest_spread_x(previous_x, previous_y, direction, grid, width, physics.max_spread_dist)
+            if new_x == previous_x:
+                new_x = _find_furthest_spread_x(previous_x, previous_y, -direction, grid, width, physics.max_spread_dist)
+            if new_x != previous_x:
+                _move_cell(world, previous_x, previous_y, new_x, previous_y)
+                x = new_x
+                grid_tx[y, x], grid_ty[y, x] = x, y
+
+    if x == previous_x and y == previous_y:
+        grid_vx[y, x] = 0.0
+        grid_vy[y, x] = 1.0
+        return False
+
+    updated_tick[y, x] = tick
+    return True
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _update_particles_kernel(world, materials, physics, chunk_awake, chunk_rect, updated_tick, tick, seed):
+    """One sand/water/acid pass over the awake chunks, from the bottom row to the top one.
+
+    Particles that already moved this frame are skipped. Returns how many particles moved.
+    """
+    return _update_rows_kernel(world, materials, physics, chunk_awake, chunk_rect, updated_tick, tick, seed, 0, world[0].shape[0] - 1)
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def _update_rows_kernel(world, materials, physics, chunk_awake, chunk_rect, updated_tick, tick, seed, top, bottom):
+    """_update_particles_kernel limited to the rows top to bottom, this is what a band of bands.py runs.
+
+    Each chunk row first lists its awake chunks in update order, with the rows
+    their rects cover, so rows and chunks that are asleep cost nothing.
+    """
+    chunks_x = chunk_awake.shape[1]
+    chunk_size = world[9]
+    forward = tick % 2 == 0  # alternate the row direction so nothing drifts to one side
+    awake_x = np.empty(chunks_x, dtype=np.int64)  # the awake chunks of the chunk row
+    moved = 0
+    for cy in range(bottom // chunk_size, top // chunk_size - 1, -1):
+        count = 0
+        rows_top, rows_bottom = bottom + 1, top - 1
+        for i in range(chunks_x):
+            cx = i if forward else chunks_x - 1 - i
+            if chunk_awake[cy, cx]:
+                awake_x[count] = cx
+                count += 1
+                rows_top = min(rows_top, chunk_rect[cy, cx, 1])
+                rows_bottom = max(rows_bottom, chunk_rect[cy, cx, 3])
+        for y in range(min(rows_bottom, bottom), max(rows_top, top) - 1, -1):
+            for k in range(count):
+                x0, y0, x1, y1 = chunk_rect[cy, awake_x[k]]
+                if y0 <= y <= y1:
+                    moved += _update_row(world, materials, physics, updated_tick, tick, seed, x0, x1, y, forward)
+    return moved
+
+
+@jit(nopython=True, cache=True)
+def _update_row(world, materials, physics, updated_tick, tick, seed, x0, x1, y, forward):
+    grid = world[0]
+    moved = 0
+    for j in range(x1 - x0 + 1):
+        x = x0 + j if forward else x1 - j
+        if updated_tick[y, x] == tick:
+            continue
+        p_type = grid[y, x]
+        if not materials[0][p_type] & (POWDER | LIQUID):
+            continue
+        if _update_particle(world, materials, physics, updated_tick, tick, seed, x, y):
+            moved += 1
+    return moved
+
+
+@jit(nopython=True, parallel=True, nogil=True, cache=True)
+def _update_particles_parallel_kernel(world, materials, physics, chunk_awake, chunk_rect, updated_tick, tick, seed):
+    """Same pass as _update_particles_kernel with the awake chunks spread over every core.
+
+    The chunks are updated in four checkerboard passes: in a pass, two chunks being
+    updated always have a whole chunk between them. A particle never moves more than
+    MAX_STEP cells, so two chunks of a pass never touch the same cell. The world must
+    mark changes in per cell flags (see parallel_world_arrays).
+    """
+    forward = tick % 2 == 0
+    moved = 0
+    for pass_index in range(4):
+        pass_y = 1 - pass_index // 2  # odd chunk rows first, roughly bottom to top
+        pass_x = pass_index % 2
+        cys, cxs = np.nonzero(chunk_awake[pass_y::2, pass_x::2])
+        for k in prange(len(cys)):
+            cy = cys[k] * 2 + pass_y
+            cx = cxs[k] * 2 + pass_x
+            x0, y0, x1, y1 = chunk_rect[cy, cx]
+            for y in range(y1, y0 - 1, -1):
+                moved += _update_row(world, materials, physics, updated_tick, tick, seed, x0, x1, y, forward)
+    return moved
+
+
+def parallel_world_arrays():
+    """world_arrays() for the parallel update, changes are flagged per cell instead of growing the rects."""
+    return (grid, grid_color, grid_vx, grid_vy, grid_tx, grid_ty, grid_lifespan, redraw_cells, changed_cells, CHUNK_SIZE)
+
+
+def check_reach(mode: str):
+    """Raises if a particle can reach further than half a chunk, the parallel update and the bands rely on it."""
+    reach = max(PHYSICS.max_step, PHYSICS.max_spread_dist) + 1  # cells a particle can read or write from its chunk border
+    if CHUNK_SIZE < 2 * reach:
+        raise ValueError(f"CHUNK_SIZE must be at least {2 * reach} for {mode}")
+
+
+def set_parallel(enabled: bool, threads: int = 0):
+    """Switches the parallel update on or off, threads = 0 keeps numba's default (every core)."""
+    global parallel
+    if enabled:
+        check_reach("the parallel update")
+    parallel = enabled
+    if threads > 0:
+        set_num_threads(threads)
+
+
+def update_particles():
+    seed = np.uint64(random_int(0, 2 ** 53))
+    if band_update is not None or parallel:
+        if band_update is not None:
+            moved = band_update(seed)
+        else:
+            moved = _update_particles_parallel_kernel(parallel_world_arrays(), MATERIAL_TABLES, PHYSICS, chunk_awake, chunk_rect, updated_tick, tick, seed)
+        chunks.fold_cells(redraw_cells, changed_cells, chunk_redraw, chunk_changed, chunk_awake, CHUNK_SIZE)
+        return moved
+    return _update_particles_kernel(world_arrays(), MATERIAL_TABLES, PHYSICS, chunk_awake, chunk_rect, updated_tick, tick, seed)
+
+
+# what step() runs, in order
+SIMULATION_STAGES = (begin_frame, update_reactions, update_particles, update_smoke_particles, update_fire_particles, update_burning_wood)
+
+
+def step():
+    """Simulates one frame: wakes the changed chunks then runs every updater."""
+    for stage in SIMULATION_STAGES:
+        stage()
+
+
+if PARALLEL_SIMULATION:
+    set_parallel(True, SIMULATION_THREADS)
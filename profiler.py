@@ -0,0 +1,79 @@
+"""Rolling per stage frame timings, shown in the toolbar when the profiler is on.
+
+Every stage of the main loop goes through measure(), which only times it while
+the profiler is enabled. draw() shows the mean of the last PROFILER_FRAMES frames
+of every stage next to the sizes given to set_size().
+"""
+import time
+from collections import deque
+import pygame
+from config import *
+
+enabled = False
+stage_times = {}  # stage name -> deque of its last durations, in seconds
+sizes = {}  # name -> value, like the number of awake chunks
+_font = None
+
+
+def toggle():
+    global enabled
+    enabled = not enabled
+    stage_times.clear()
+    sizes.clear()
+
+
+def measure(stage: str, function, *args):
+    """Calls function(*args) and records how long it took under stage."""
+    if not enabled:
+        return function(*args)
+    start = time.perf_counter()
+    result = function(*args)
+    record(stage, time.perf_counter() - start)
+    return result
+
+
+def record(stage: str, seconds: float):
+    if stage not in stage_times:
+        stage_times[stage] = deque(maxlen=PROFILER_FRAMES)
+    stage_times[stage].append(seconds)
+
+
+def set_size(name: str, value: int):
+    sizes[name] = value
+
+
+def averages():
+    """Mean ms of every stage over the last frames, in the order the stages ran."""
+    return {stage: 1000 * sum(times) / len(times) for stage, times in list(stage_times.items())}  # the simulation thread may add stages
+
+
+def draw(target_screen, fps: float, ticks_per_second: int, x: int, y: int):
+    """Draws the stage timings, the total and the sizes in columns from (x, y) to the bottom of the window.
+
+    The columns are as wide as their longest line. When they don't fit across the
+    toolbar, the box gets more rows and starts higher than y.
+    """
+    global _font
+    if _font is None:
+        _font = pygame.font.SysFont("Arial", 13)
+    stages = averages()
+    lines = [f"fps: {fps:.0f}", f"ticks/s: {ticks_per_second}", f"frame: {sum(stages.values()):.2f} ms"]
+    lines += [f"{stage.removeprefix('update_')}: {ms:.2f} ms" for stage, ms in stages.items()]
+    lines += [f"{name}: {value}" for name, value in sizes.items()]
+    texts = [_font.render(line, True, (255, 255, 255)) for line in lines]
+    box_width = TOOLBAR_WIDTH - 20
+    rows = max((WINDOW_HEIGHT - y - 5 - 8) // 13, 1)
+    while True:
+        columns = [texts[index:index + rows] for index in range(0, len(texts), rows)]
+        widths = [max(text.get_width() for text in column) for column in columns]
+        if len(columns) <= 1 or sum(widths) + 12 * (len(columns) - 1) + 16 <= box_width:
+            break
+        rows += 1
+    height = max(WINDOW_HEIGHT - y - 5, rows * 13 + 8)
+    y = WINDOW_HEIGHT - 5 - height
+    pygame.draw.rect(target_screen, (35, 38, 45), (x, y, box_width, height), border_radius=5)
+    column_x = x + 8
+    for column, width in zip(columns, widths):
+        for row, text in enumerate(column):
+            target_screen.blit(text, (column_x, y + 4 + row * 13))
+        column_x += width + 12
@@ -0,0 +1,133 @@
+"""Records the brush strokes of a session and replays them, with or without a window.
+
+A recording starts with a snapshot of the world (see snapshot.py) and keeps, for
+every frame, how many simulation ticks ran and which strokes were drawn. The replay
+loads the snapshot and feeds the same strokes at the same frames as fast as it
+can, so a laggy session becomes a case that can be profiled and compared:
+
+    python recording.py recording.json --window
+"""
+import argparse
+import json
+import time
+import numpy as np
+import config
+import headless
+import particle_system
+import snapshot
+
+RECORDING_VERSION = 2
+
+current = None  # the recording in progress, None when not recording
+_path = None
+
+
+def start(path: str):
+    """Starts recording from the next frame, the world is saved next to path when that frame starts."""
+    global current, _path
+    _path = path
+    current = {
+        "version": RECORDING_VERSION,
+        "snapshot": path.rsplit(".", 1)[0] + ".npz",
+        "random_velocity": config.random_velocity,
+        "frames": 0,
+        "ticks": [],  # simulation ticks run at the start of every frame
+        "events": [],  # [frame, kind, material, radius, x0, y0, x1, y1]
+    }
+
+
+def stop():
+    """Writes the recording to the file given to start()."""
+    global current
+    with open(_path, "w") as file:
+        json.dump(current, file)
+    current = None
+
+
+def toggle(path: str):
+    if current is None:
+        start(path)
+    else:
+        stop()
+
+
+def record_frame(ticks: int):
+    """To call at the start of every frame, before the simulation runs its ticks."""
+    if current is None:
+        return
+    if current["frames"] == 0:
+        snapshot.save(current["snapshot"])
+    current["ticks"].append(ticks)
+    current["frames"] += 1
+
+
+def record_stroke(material: int, radius: int, x0: int, y0: int, x1: int, y1: int):
+    """EMPTY_ID for an erase stroke."""
+    if current is not None and current["frames"] > 0:  # before the first frame the stroke is in the snapshot
+        current["events"].append([current["frames"] - 1, "stroke", material, radius, x0, y0, x1, y1])
+
+
+def record_clear():
+    if current is not None and current["frames"] > 0:
+        current["events"].append([current["frames"] - 1, "clear", 0, 0, 0, 0, 0, 0])
+
+
+def replay(path: str, draw=None):
+    """Replays the recording in path, returns the duration of every frame in seconds.
+
+    draw, if given, is called after every frame, like main.py draws the world.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    if data["version"] != RECORDING_VERSION:
+        raise ValueError(f"{path} is a version {data['version']} recording, expected version {RECORDING_VERSION}")
+    snapshot.load(data["snapshot"])
+    config.random_velocity = data["random_velocity"]
+    events = data["events"]
+    next_event = 0
+    frame_times = []
+    for frame in range(data["frames"]):
+        start = time.perf_counter()
+        for _ in range(data["ticks"][frame]):
+            particle_system.step()
+        while next_event < len(events) and events[next_event][0] == frame:
+            _, kind, material, radius, x0, y0, x1, y1 = events[next_event]
+            if kind == "clear":
+                particle_system.clear_world()
+            else:
+                headless.stroke(material, x0, y0, x1, y1, radius)
+            next_event += 1
+        if draw is not None:
+            draw()
+        config.frame_count += 1
+        frame_times.append(time.perf_counter() - start)
+    return frame_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a recording at full speed.")
+    parser.add_argument("path")
+    parser.add_argument("--window", action="store_true", help="show the world while it is replayed")
+    args = parser.parse_args()
+
+    draw = None
+    if args.window:
+        import pygame
+        pygame.init()
+        screen = pygame.display.set_mode((config.SCREEN_WIDTH, config.WINDOW_HEIGHT))
+
+        def draw():
+            pygame.event.pump()
+            particle_system.draw_grid(screen)
+            particle_system.cycle_colors(config.CHROMATIC_PALETTE, config.palette_size, config.frame_count / config.FPS_LIMIT)
+            pygame.display.flip()
+
+    particle_system.initialize_grid()
+    particle_system.update_particles()  # warm-up for jit functions
+    frame_ms = np.array(replay(args.path, draw)) * 1000
+    print(f"{len(frame_ms)} frames in {frame_ms.sum() / 1000:.3f}s, "
+          f"mean {frame_ms.mean():.2f} ms, p50 {np.percentile(frame_ms, 50):.2f} ms, p99 {np.percentile(frame_ms, 99):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
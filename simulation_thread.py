@@ -0,0 +1,124 @@
+"""Runs the simulation on a background thread, so a slow tick doesn't freeze the window.
+
+The thread owns the world. After every batch of ticks it copies the changed
+chunks into a frame (a copy of grid and grid_color) that the window draws, so
+the window never reads cells the thread is moving. Everything else that touches
+the world (brush strokes, clear, save, load, recording) is queued with submit()
+and run by the thread between two ticks, in the order it was submitted.
+
+Without start() nothing runs in the background: submit() calls the function
+right away and main.py simulates with simulate_frame() itself.
+"""
+import queue
+import threading
+import chunks
+import config
+import paging
+import particle_system
+import profiler
+import recording
+import timestep
+
+thread = None  # the simulation thread, None when the window simulates itself
+_commands = queue.Queue()  # (function, args) to run on the world
+_lock = threading.Lock()  # held while the world or the frame is replaced
+_stopping = threading.Event()
+_error = None  # what stopped the thread, raised again by draw()
+
+frame_grid = None
+frame_color = None
+frame_redraw = None  # chunks of the frame not drawn yet
+
+
+def simulate_frame():
+    """Runs the ticks due since the last call, returns how many ran."""
+    ticks = timestep.ticks_due(config.simulation_is_on)
+    recording.record_frame(ticks)
+    for _ in range(ticks):
+        for stage in particle_system.SIMULATION_STAGES:
+            profiler.measure(stage.__name__, stage)
+    paging.update()
+    return ticks
+
+
+def submit(function, *args):
+    """Runs function(*args) on the world, on the simulation thread if it is running."""
+    if thread is None:
+        function(*args)
+    else:
+        _commands.put((function, args))
+
+
+def _run_commands(timeout: float):
+    """Runs the submitted commands, waiting up to timeout for the first one."""
+    try:
+        function, args = _commands.get(timeout=timeout)
+        while True:
+            with _lock:
+                function(*args)
+            function, args = _commands.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def _publish():
+    """Copies the chunks redrawn since the last frame into the frame."""
+    global frame_grid, frame_color, frame_redraw
+    rects = chunks.rects_in_use(particle_system.chunk_redraw)
+    with _lock:
+        if frame_grid is None or frame_grid.shape != particle_system.grid.shape:  # a new world
+            height, width = particle_system.grid.shape
+            frame_grid = particle_system.grid.copy()
+            frame_color = particle_system.grid_color.copy()
+            paging.mark_all_loaded()
+            frame_redraw = chunks.new_rects(width, height)
+            chunks.fill_rects(frame_redraw, width, height, config.CHUNK_SIZE)
+        else:
+            for x0, y0, x1, y1 in rects:
+                frame_grid[y0:y1 + 1, x0:x1 + 1] = particle_system.grid[y0:y1 + 1, x0:x1 + 1]
+                frame_color[y0:y1 + 1, x0:x1 + 1] = particle_system.grid_color[y0:y1 + 1, x0:x1 + 1]
+            chunks.merge_rects(frame_redraw, particle_system.chunk_redraw)
+    chunks.clear_rects(particle_system.chunk_redraw)
+
+
+def _run():
+    global _error
+    try:
+        while not _stopping.is_set():
+            simulate_frame()
+            _publish()
+            _run_commands(timestep.until_next_tick())
+    except BaseException as error:
+        _error = error
+
+
+def start():
+    global thread
+    _stopping.clear()
+    _publish()
+    thread = threading.Thread(target=_run, name="simulation", daemon=True)
+    thread.start()
+
+
+def stop():
+    """Runs the commands still queued then stops the thread."""
+    global thread
+    if thread is None:
+        return
+    _stopping.set()
+    thread.join()
+    thread = None
+    _run_commands(0)
+
+
+def draw(target_screen):
+    """Draws the last frame of the simulation thread, or the world when there is no thread."""
+    if thread is None:
+        particle_system.draw_grid(target_screen)
+        return
+    if _error is not None:
+        raise RuntimeError("the simulation thread stopped") from _error
+    with _lock:
+        if frame_grid.shape[::-1] != particle_system.grid_surface.get_size():  # resized, the next frame follows
+            return
+        particle_system.draw_cells(target_screen, frame_redraw, frame_grid, frame_color)
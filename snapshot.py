@@ -0,0 +1,51 @@
+"""Saves and loads the whole world as one uncompressed .npz file.
+
+Every world array is stored as is, with the pending chunk wakes, the tick and
+the state of the random stream. A load is a few array copies, and a world
+loaded from a snapshot runs the same frames as the one that was saved.
+"""
+import json
+import numpy as np
+import chunks
+import paging
+import particle_system
+
+SNAPSHOT_VERSION = 4  # 2: grid_color indexes the 256 color palette, 3: previous_grid and kept_cells, 4: chunk_timer
+WORLD_ARRAYS = ("grid", "grid_color", "grid_vx", "grid_vy", "grid_tx", "grid_ty", "grid_lifespan", "chunk_changed",
+                "previous_grid", "kept_cells", "chunk_timer")
+
+
+def save(path: str):
+    particle_system.random_block = particle_system.random_block[particle_system.random_index:]
+    particle_system.random_index = 0  # only the numbers not used yet are saved
+    random_state = json.dumps(particle_system.random_generator.bit_generator.state)
+    np.savez(
+        path,
+        version=np.array(SNAPSHOT_VERSION),
+        tick=np.array(particle_system.tick),
+        random_state=np.array(random_state),
+        random_block=np.array(particle_system.random_block, dtype=np.float64),
+        **{name: getattr(particle_system, name) for name in WORLD_ARRAYS},
+    )
+    paging.mark_all_loaded()
+
+
+def load(path: str):
+    """Replaces the world by the one saved in path, its size included."""
+    with np.load(path) as data:
+        if int(data["version"]) != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is a version {int(data['version'])} snapshot, expected version {SNAPSHOT_VERSION}")
+        height, width = data["grid"].shape
+        if particle_system.grid.shape == (height, width):  # no need to allocate a new world
+            particle_system.updated_tick[...] = -1
+        else:
+            particle_system.initialize_grid(width, height)
+        for name in WORLD_ARRAYS:
+            getattr(particle_system, name)[...] = data[name]
+        particle_system.tick = int(data["tick"])
+        particle_system.woken_tick = -1
+        particle_system.random_generator.bit_generator.state = json.loads(str(data["random_state"]))
+        particle_system.random_block = data["random_block"].tolist()
+        particle_system.random_index = 0
+    paging.mark_all_loaded()
+    chunks.fill_rects(particle_system.chunk_redraw, width, height, particle_system.CHUNK_SIZE)
@@ -0,0 +1,47 @@
+"""Fixed timestep: the simulation runs SIMULATION_TICKS_PER_SECOND ticks per second
+whatever the render rate.
+
+Every rendered frame asks ticks_due() how many ticks to run. A slow display gets
+several ticks per frame, a fast one gets frames with no tick. When even
+MAX_CATCH_UP_TICKS ticks can't keep up, the time left is dropped and the
+simulation slows down instead of falling further behind.
+"""
+import time
+from collections import deque
+from config import *
+
+TICK_SECONDS = 1 / SIMULATION_TICKS_PER_SECOND
+
+_accumulator = TICK_SECONDS  # the first frame runs one tick
+_last_time = None
+_tick_times = deque()  # when the ticks of the last second were handed out
+
+
+def ticks_due(running: bool = True):
+    """Number of ticks to run this frame. When not running the time passes without ticks."""
+    global _accumulator, _last_time
+    now = time.perf_counter()
+    if _last_time is not None:
+        _accumulator += now - _last_time
+    _last_time = now
+    if not running:
+        _accumulator = 0.0
+        return 0
+    ticks = min(int(_accumulator / TICK_SECONDS), MAX_CATCH_UP_TICKS)
+    _accumulator -= ticks * TICK_SECONDS
+    if ticks == MAX_CATCH_UP_TICKS:
+        _accumulator = min(_accumulator, TICK_SECONDS)  # too far behind, let it go
+    _tick_times.extend([now] * ticks)
+    return ticks
+
+
+def until_next_tick():
+    """Seconds before ticks_due() returns a tick again."""
+    return max(TICK_SECONDS - _accumulator, 0.0)
+
+
+def tick_rate():
+    """Ticks run over the last second."""
+    while _tick_times and _tick_times[0] < time.perf_counter() - 1.0:
+        _tick_times.popleft()
+    return len(_tick_times)
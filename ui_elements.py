@@ -18,6 +18,7 @@ material_display_label = None
 pause_button = None
 clear_button = None
 acid_button = None
+profiler_button = None
 
 
 def update_brush_label_text(text):
@@ -31,7 +32,7 @@ def update_material_label_text(text):
 
 
 def init_ui(target_screen):
-    global brush_slider, brush_size_label, sand_button, water_button, stone_button, chromatic_button, steam_button, fire_button, wood_button, material_display_label, pause_button, clear_button, acid_button
+    global brush_slider, brush_size_label, sand_button, water_button, stone_button, chromatic_button, steam_button, fire_button, wood_button, material_display_label, pause_button, clear_button, acid_button, profiler_button
     sand_button = Button(
         target_screen,
         SCREEN_WIDTH + 50,  # X-coordinate of top left corner
@@ -164,6 +165,22 @@ def init_ui(target_screen):
         radius=10,
     )
 
+    profiler_button = Button(
+        target_screen,
+        SCREEN_WIDTH + 260,  # X-coordinate
+        320,  # Y-coordinate
+        95,   # Width
+        50,   # Height
+        text="Stats",
+        font=pygame.font.SysFont("Arial", 24, bold=True),
+        margin=10,
+        textColour=(255, 255, 255),
+        inactiveColour=(108, 117, 125),
+        hoverColour=(90, 98, 104),
+        pressedColour=(84, 91, 98),
+        radius=10,
+    )
+
     material_display_label = TextBox(
         target_screen,
         SCREEN_WIDTH + 100, 380,  # X, Y